@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+
+from cache import LRUCache
+from ocr_cache import hash_file
+
+# Parsed PDFs kept per process (documents, not pages) and anchor texts kept per page
+ANCHOR_CACHE_DOCUMENTS = int(os.environ.get("ANCHOR_CACHE_DOCUMENTS", "8"))
+ANCHOR_CACHE_PAGES = int(os.environ.get("ANCHOR_CACHE_PAGES", "2048"))
+
+
+class AnchorTextCache:
+    """Reuses one parsed PdfReader per document for olmocr's "pdfreport" anchor text.
+
+    olmocr's get_anchor_text opens a fresh PdfReader (re-reading the xref table and page tree) on every
+    call, so processing a long document page by page parses it once per page. Here the reader is cached
+    by file hash, the page report is built from it with olmocr's own report types and linearized by
+    olmocr, and finished anchor texts are cached per page. Timing counters show how much anchor
+    extraction costs and how often the caches save it.
+
+    The cache is per process: each spawn render worker (OCR_RENDER_WORKERS) has its own, so every worker
+    that handles pages of a document still parses that document once.
+    """
+
+    def __init__(self, max_documents=ANCHOR_CACHE_DOCUMENTS, max_pages=ANCHOR_CACHE_PAGES):
+        self._readers = LRUCache(max_entries=max_documents)
+        self._texts = LRUCache(max_entries=max_pages)
+        self._hashes = LRUCache(max_entries=max_documents * 4)
+        # pypdf readers are not thread-safe
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self.calls = 0
+        self.page_hits = 0
+        self.document_parses = 0
+        self.document_reuses = 0
+        self.total_seconds = 0.0
+
+    def _file_hash(self, pdf_path):
+        # Hashing is linear in file size, so only rehash when the file itself changes
+        stat = os.stat(pdf_path)
+        fingerprint = (os.path.abspath(pdf_path), stat.st_mtime_ns, stat.st_size)
+        file_hash = self._hashes.get(fingerprint)
+        if file_hash is None:
+            file_hash = hash_file(pdf_path)
+            self._hashes.put(fingerprint, file_hash)
+        return file_hash
+
+    def get_anchor_text(self, pdf_path, page_num, target_length=4000):
+        """Same result as olmocr's get_anchor_text(pdf_path, page_num, pdf_engine="pdfreport", target_length=...)."""
+        from olmocr.prompts.anchor import _linearize_pdf_report
+        from pypdf import PdfReader
+
+        start = time.perf_counter()
+        file_hash = self._file_hash(pdf_path)
+        text_key = (file_hash, page_num, target_length)
+        anchor_text = self._texts.get(text_key)
+        page_hit = anchor_text is not None
+        reused = False
+        if anchor_text is None:
+            with self._lock:
+                reader = self._readers.get(file_hash)
+                reused = reader is not None
+                if reader is None:
+                    reader = PdfReader(pdf_path)
+                    self._readers.put(file_hash, reader)
+                anchor_text = _linearize_pdf_report(_page_report(reader, page_num), max_length=target_length)
+            self._texts.put(text_key, anchor_text)
+        self.record(time.perf_counter() - start, page_hit=page_hit, reused=reused)
+        return anchor_text
+
+    def clear(self):
+        """Forget all parsed documents and anchor texts (counters are kept)."""
+        with self._lock:
+            self._readers.clear()
+            self._texts.clear()
+            self._hashes.clear()
+
+    def record(self, seconds, page_hit=False, reused=False):
+        with self._stats_lock:
+            self.calls += 1
+            self.total_seconds += seconds
+            if page_hit:
+                self.page_hits += 1
+            elif reused:
+                self.document_reuses += 1
+            else:
+                self.document_parses += 1
+
+    def drain_stats(self):
+        """Return and reset the raw counters (used to ship stats from render workers to the parent)."""
+        with self._stats_lock:
+            counters = {
+                "calls": self.calls,
+                "page_hits": self.page_hits,
+                "document_parses": self.document_parses,
+                "document_reuses": self.document_reuses,
+                "total_seconds": self.total_seconds,
+            }
+            self._reset_counters()
+        return counters
+
+    def merge_stats(self, counters):
+        """Add counters drained from another process."""
+        with self._stats_lock:
+            self.calls += counters["calls"]
+            self.page_hits += counters["page_hits"]
+            self.document_parses += counters["document_parses"]
+            self.document_reuses += counters["document_reuses"]
+            self.total_seconds += counters["total_seconds"]
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "calls": self.calls,
+                "page_hits": self.page_hits,
+                "document_parses": self.document_parses,
+                "document_reuses": self.document_reuses,
+                "total_seconds": self.total_seconds,
+                "mean_ms": 1000 * self.total_seconds / self.calls if self.calls else 0.0,
+            }
+
+
+def _page_report(reader, page_num):
+    """olmocr's _pdf_report(path, page_num) for an already parsed reader: text runs and image placements."""
+    from olmocr.prompts.anchor import BoundingBox, ImageElement, PageReport, TextElement, _mult, _transform_point
+
+    page = reader.pages[page_num - 1]
+    xobjects = page.get("/Resources", {}).get("/XObject", {})
+    text_elements, image_elements = [], []
+
+    def visitor_body(text, cm, tm, font_dict, font_size):
+        txt2user = _mult(tm, cm)
+        text_elements.append(TextElement(text, txt2user[4], txt2user[5]))
+
+    def visitor_op(op, args, cm, tm):
+        if op == b"Do":
+            xobject_name = args[0]
+            xobject = xobjects.get(xobject_name)
+            if xobject and xobject["/Subtype"] == "/Image":
+                # The image is placed on the unit square by the CTM
+                x0, y0 = _transform_point(0, 0, cm)
+                x1, y1 = _transform_point(1, 1, cm)
+                image_elements.append(ImageElement(xobject_name, BoundingBox(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))))
+
+    page.extract_text(visitor_text=visitor_body, visitor_operand_before=visitor_op)
+    return PageReport(
+        mediabox=BoundingBox.from_rectangle(page.mediabox),
+        text_elements=text_elements,
+        image_elements=image_elements,
+    )
+
+
+anchor_text_cache = AnchorTextCache()
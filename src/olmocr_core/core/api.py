@@ -1,11 +1,28 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Optional
+import asyncio
+import json
 import shutil
 import os
 import tempfile
-from ocr import run_ocr
-from inference import run_llm_extraction
+import threading
+from extraction_schemas import ExtractionOutputError
+from inference import extraction_stats, run_llm_extraction_async, stream_llm_extraction_async
+from ocr_backends import ocr_backend
+from batch_scheduler import OCRBatchScheduler
+from json_stream import IncrementalJSONParser
+from jobs import TERMINAL_STATUSES, JobManager
+from ollama_client import ollama
+from ocr_cache import ocr_result_cache
+from anchor_cache import anchor_text_cache
+from llm_cache import llm_result_cache
+from metrics import CacheStatsCollector, RequestMetricsMiddleware, time_stage
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI()
@@ -18,75 +35,394 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestMetricsMiddleware)
+
+# Cache hit/miss counters are read from the caches' own stats when /metrics is scraped
+TIERED_CACHE_RESULTS = {"memory_hits": "memory_hit", "disk_hits": "disk_hit", "misses": "miss"}
+REGISTRY.register(CacheStatsCollector({
+    "ocr": (ocr_result_cache.stats, TIERED_CACHE_RESULTS),
+    "llm": (llm_result_cache.stats, TIERED_CACHE_RESULTS),
+    "anchor_text": (anchor_text_cache.stats, {"page_hits": "page_hit", "document_reuses": "document_reuse", "document_parses": "document_parse"}),
+}))
+
+# Set OCR_WARMUP_ON_STARTUP=1 on workers that serve the OCR endpoints to start loading the model
+# as soon as the server is up instead of on the first OCR request.
+OCR_WARMUP_ON_STARTUP = os.environ.get("OCR_WARMUP_ON_STARTUP", "0") == "1"
+
+@app.on_event("startup")
+def warmup_on_startup():
+    if OCR_WARMUP_ON_STARTUP:
+        # Load in the background so the server accepts requests (and reports readiness) immediately
+        threading.Thread(target=_warmup_ocr_model, daemon=True).start()
+
+# All model work runs on this dedicated executor instead of Starlette's shared threadpool, so requests
+# waiting on the GPU cannot starve /docs, /health or the Ollama-bound endpoints of threads.
+OCR_GPU_WORKERS = int(os.environ.get("OCR_GPU_WORKERS", "1"))
+ocr_executor = ThreadPoolExecutor(max_workers=OCR_GPU_WORKERS, thread_name_prefix="ocr-gpu")
+
+async def run_on_ocr_executor(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(ocr_executor, partial(func, *args, **kwargs))
+
+def _run_ocr_batch(items):
+    from ocr import run_ocr_batch
+    return run_ocr_batch(items)
+
+# Concurrent single-page OCR requests are grouped into batched generate calls on the OCR executor
+ocr_scheduler = OCRBatchScheduler(_run_ocr_batch, ocr_executor)
+
+# Long documents run as background jobs; their model work shares the OCR executor with live requests
+job_manager = JobManager(model_executor=ocr_executor)
+
+@app.on_event("startup")
+def resume_jobs():
+    job_manager.resume_unfinished()
+
+@app.on_event("shutdown")
+async def close_clients():
+    job_manager.shutdown()
+    await ocr_scheduler.stop()
+    await ollama.aclose()
+    ocr_backend.close()
+    ocr_executor.shutdown(wait=False)
+
+def _warmup_ocr_model():
+    try:
+        ocr_backend.load()
+    except Exception as e:
+        print(f"OCR model warm-up failed: {e}")
 
 class LLMExtractRequest(BaseModel):
     ocr_text: str
+    use_cache: bool = True
 
 class LLMExtractResponse(BaseModel):
     parsed_json: dict
 
+class OCRPageResult(BaseModel):
+    page_num: int
+    ocr_text: str
+
 class OCRExtractResponse(BaseModel):
     ocr_text: str
+    pages: Optional[List[OCRPageResult]] = None
 
 class FullPipelineResponse(BaseModel):
     ocr_text: str
     parsed_json: dict
 
+class JobProgress(BaseModel):
+    completed_pages: int
+    total_pages: Optional[int] = None
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    filename: Optional[str] = None
+    progress: JobProgress
+    pages: List[OCRPageResult] = []
+    parsed_json: Optional[dict] = None
+    error: Optional[str] = None
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "ocr_model": ocr_backend.status(),
+        "ocr_cache": ocr_result_cache.stats(),
+        "llm_cache": llm_result_cache.stats(),
+        "llm_extraction": extraction_stats.stats(),
+        "ocr_batching": ocr_scheduler.stats(),
+        "anchor_text": anchor_text_cache.stats(),
+    }
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/ready")
+async def ready():
+    if not await run_in_threadpool(ocr_backend.check_ready):
+        return JSONResponse(status_code=503, content={"ready": False, "ocr_model": ocr_backend.status()})
+    return {"ready": True, "ocr_model": ocr_backend.status()}
+
+@app.post("/warmup")
+async def warmup():
+    try:
+        await run_on_ocr_executor(ocr_backend.load)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"OCR model warm-up failed: {str(e)}")
+    return {"ready": True, "ocr_model": ocr_backend.status()}
+
+def _save_upload(file: UploadFile) -> str:
+    with time_stage("upload"), tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as temp_file:
+        shutil.copyfileobj(file.file, temp_file)
+        return temp_file.name
+
+async def _run_ocr_page(temp_path, page_num, use_cache=True):
+    """OCR one page through the micro-batching scheduler, answering from the OCR cache when possible."""
+    import ocr
+    use_cache = use_cache and ocr.OCR_CACHE_ENABLED
+    if use_cache:
+        cache_key, cached = await run_in_threadpool(ocr.get_cached_page, temp_path, page_num)
+        if cached is not None:
+            return cached
+    if not os.path.exists(temp_path):
+        raise FileNotFoundError(f"File not found: {temp_path}")
+    # Rendering and anchor extraction run on the general threadpool so they overlap with generation
+    image, anchor_text = await run_in_threadpool(ocr.process_file, temp_path, page_num)
+    ocr_text = await ocr_scheduler.submit(image, anchor_text)
+    if use_cache and ocr.is_complete_ocr_output(ocr_text):
+        ocr_result_cache.put(cache_key, ocr_text)
+    return ocr_text
+
 @app.post("/ocr-extract", response_model=OCRExtractResponse)
-def ocr_extract(file: UploadFile = File(...), page_num: int = 1):
+async def ocr_extract(file: UploadFile = File(...), page_num: int = 1, pages: Optional[str] = None, batch_size: int = 1):
     if not file.filename.lower().endswith((".pdf", ".jpg", ".jpeg", ".png")):
         raise HTTPException(status_code=400, detail="File must be a PDF or image.")
+    # Imported lazily so workers that only serve /llm-extract never pull in the OCR stack
+    from ocr import run_ocr_pages
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as temp_file:
-            shutil.copyfileobj(file.file, temp_file)
-            temp_path = temp_file.name
-        ocr_output_path = temp_path + "_ocr.txt"
-        run_ocr(temp_path, page_num=page_num, output_file=ocr_output_path)
-        with open(ocr_output_path, "r", encoding="utf-8") as f:
-            ocr_text = f.read()
-        os.remove(temp_path)
-        os.remove(ocr_output_path)
+        temp_path = await run_in_threadpool(_save_upload, file)
+        if pages is not None:
+            # Whole-document mode: one upload, one result per selected page
+            try:
+                page_results = await run_on_ocr_executor(
+                    lambda: list(run_ocr_pages(temp_path, pages=pages, batch_size=batch_size))
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            finally:
+                os.remove(temp_path)
+            ocr_text = "\n\n".join(page["ocr_text"] for page in page_results)
+            return {"ocr_text": ocr_text, "pages": page_results}
+        try:
+            ocr_text = await _run_ocr_page(temp_path, page_num)
+        finally:
+            os.remove(temp_path)
         return {"ocr_text": ocr_text}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OCR extraction failed: {str(e)}")
 
+@app.post("/ocr-extract/pages")
+async def ocr_extract_pages(file: UploadFile = File(...), pages: str = "all", batch_size: int = 1):
+    """Stream per-page OCR results as newline-delimited JSON while later pages are still being processed."""
+    if not file.filename.lower().endswith((".pdf", ".jpg", ".jpeg", ".png")):
+        raise HTTPException(status_code=400, detail="File must be a PDF or image.")
+    from ocr import run_ocr_pages, select_pages
+    temp_path = await run_in_threadpool(_save_upload, file)
+    # Reject a bad page selection with a 400 before the 200 stream starts
+    try:
+        await run_in_threadpool(select_pages, temp_path, pages)
+    except ValueError as e:
+        os.remove(temp_path)
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def stream_pages():
+        page_iter = run_ocr_pages(temp_path, pages=pages, batch_size=batch_size)
+        pending = None
+        try:
+            while True:
+                # Each page is produced on the OCR executor; the event loop stays free in between.
+                # Shielded so a client disconnect does not abandon a next() still running there
+                pending = asyncio.ensure_future(run_on_ocr_executor(next, page_iter, None))
+                page = await asyncio.shield(pending)
+                if page is None:
+                    break
+                yield json.dumps(page) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": f"OCR extraction failed: {str(e)}"}) + "\n"
+        finally:
+            try:
+                # close() fails on a generator that is still running, so wait for the current page first;
+                # closing stops the render prefetch for the pages that will not be sent
+                if pending is not None:
+                    await asyncio.gather(pending, return_exceptions=True)
+                await run_on_ocr_executor(page_iter.close)
+            finally:
+                os.remove(temp_path)
+
+    return StreamingResponse(stream_pages(), media_type="application/x-ndjson")
+
+def _sse(event, data):
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _stream_ocr_tokens(run_ocr, temp_path, page_num, use_cache):
+    """Run OCR on the OCR executor and yield ("token", text) as it is generated, then ("done", ocr_text).
+
+    ("field", (key, value)) is yielded as soon as a top-level field of the olmOCR JSON (primary_language,
+    is_table, ...) is complete, before the rest of the page has been generated.
+    """
+    loop = asyncio.get_running_loop()
+    parser = IncrementalJSONParser()
+    queue = asyncio.Queue()
+    done = object()
+
+    def on_text(text):
+        # Called from the executor thread; hand each chunk over to the event loop
+        loop.call_soon_threadsafe(queue.put_nowait, text)
+
+    future = loop.run_in_executor(
+        ocr_executor,
+        partial(run_ocr, temp_path, page_num=page_num, use_cache=use_cache, on_text=on_text),
+    )
+    future.add_done_callback(lambda _: queue.put_nowait(done))
+    while True:
+        text = await queue.get()
+        if text is done:
+            break
+        yield "token", text
+        for field in parser.feed(text):
+            yield "field", field
+    yield "done", await future
+
+@app.post("/ocr-extract/stream")
+async def ocr_extract_stream(file: UploadFile = File(...), page_num: int = 1, use_cache: bool = True):
+    """Stream OCR tokens as Server-Sent Events: `ocr_token` per chunk, `ocr_field` as each top-level
+    field of the olmOCR JSON completes, then `ocr_done` with the full text."""
+    if not file.filename.lower().endswith((".pdf", ".jpg", ".jpeg", ".png")):
+        raise HTTPException(status_code=400, detail="File must be a PDF or image.")
+    from ocr import run_ocr
+    temp_path = await run_in_threadpool(_save_upload, file)
+
+    async def events():
+        try:
+            async for kind, value in _stream_ocr_tokens(run_ocr, temp_path, page_num, use_cache):
+                if kind == "token":
+                    yield _sse("ocr_token", {"text": value})
+                elif kind == "field":
+                    yield _sse("ocr_field", {"key": value[0], "value": value[1]})
+                else:
+                    yield _sse("ocr_done", {"ocr_text": value})
+        except Exception as e:
+            yield _sse("error", {"detail": f"OCR extraction failed: {str(e)}"})
+        finally:
+            os.remove(temp_path)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 @app.post("/llm-extract", response_model=LLMExtractResponse)
-def llm_extract(request: LLMExtractRequest):
+async def llm_extract(request: LLMExtractRequest):
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".txt", mode="w", encoding="utf-8") as temp_ocr:
-            temp_ocr.write(request.ocr_text)
-            temp_ocr_path = temp_ocr.name
-        temp_parsed_path = temp_ocr_path + "_parsed.json"
-        run_llm_extraction(temp_ocr_path, temp_parsed_path)
-        with open(temp_parsed_path, "r", encoding="utf-8") as f:
-            import json
-            parsed_json = json.load(f)
-        os.remove(temp_ocr_path)
-        os.remove(temp_parsed_path)
+        parsed_json = await run_llm_extraction_async(request.ocr_text, use_cache=request.use_cache)
         return {"parsed_json": parsed_json}
+    except ExtractionOutputError as e:
+        # The model answered, but not in the schema: a bad upstream response rather than a server fault
+        raise HTTPException(status_code=502, detail=f"LLM extraction failed: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"LLM extraction failed: {str(e)}")
 
 @app.post("/full-pipeline", response_model=FullPipelineResponse)
-def full_pipeline(file: UploadFile = File(...), page_num: int = 1):
+async def full_pipeline(file: UploadFile = File(...), page_num: int = 1, use_cache: bool = True):
     if not file.filename.lower().endswith((".pdf", ".jpg", ".jpeg", ".png")):
         raise HTTPException(status_code=400, detail="File must be a PDF or image.")
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as temp_file:
-            shutil.copyfileobj(file.file, temp_file)
-            temp_path = temp_file.name
-        ocr_output_path = temp_path + "_ocr.txt"
-        parsed_output_path = temp_path + "_parsed.json"
-        run_ocr(temp_path, page_num=page_num, output_file=ocr_output_path)
-        with open(ocr_output_path, "r", encoding="utf-8") as f:
-            ocr_text = f.read()
-        run_llm_extraction(ocr_output_path, parsed_output_path)
-        with open(parsed_output_path, "r", encoding="utf-8") as f:
-            import json
-            parsed_json = json.load(f)
-        os.remove(temp_path)
-        os.remove(ocr_output_path)
-        os.remove(parsed_output_path)
+        temp_path = await run_in_threadpool(_save_upload, file)
+        try:
+            ocr_text = await _run_ocr_page(temp_path, page_num, use_cache=use_cache)
+        finally:
+            os.remove(temp_path)
+        # OCR output is handed to extraction in memory; nothing else touches the disk
+        parsed_json = await run_llm_extraction_async(ocr_text, use_cache=use_cache)
         return {"ocr_text": ocr_text, "parsed_json": parsed_json}
+    except ExtractionOutputError as e:
+        raise HTTPException(status_code=502, detail=f"LLM extraction failed: {str(e)}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Full pipeline failed: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Full pipeline failed: {str(e)}")
+
+@app.post("/full-pipeline/stream")
+async def full_pipeline_stream(file: UploadFile = File(...), page_num: int = 1, use_cache: bool = True):
+    """Streaming /full-pipeline as Server-Sent Events.
+
+    Events: `ocr_token`* (with `ocr_field` as olmOCR fields complete), `ocr_done`, `llm_token`* (with
+    `llm_field` as extraction fields such as `entities` or `tables` complete), then `result` with
+    {"ocr_text", "parsed_json"}; `error` replaces the remaining events if a stage fails.
+    """
+    if not file.filename.lower().endswith((".pdf", ".jpg", ".jpeg", ".png")):
+        raise HTTPException(status_code=400, detail="File must be a PDF or image.")
+    from ocr import run_ocr
+    temp_path = await run_in_threadpool(_save_upload, file)
+
+    async def events():
+        try:
+            ocr_text = None
+            async for kind, value in _stream_ocr_tokens(run_ocr, temp_path, page_num, use_cache):
+                if kind == "token":
+                    yield _sse("ocr_token", {"text": value})
+                elif kind == "field":
+                    yield _sse("ocr_field", {"key": value[0], "value": value[1]})
+                else:
+                    ocr_text = value
+                    yield _sse("ocr_done", {"ocr_text": ocr_text})
+        except Exception as e:
+            yield _sse("error", {"detail": f"OCR extraction failed: {str(e)}"})
+            return
+        finally:
+            os.remove(temp_path)
+        try:
+            async for kind, value in stream_llm_extraction_async(ocr_text, use_cache=use_cache):
+                if kind == "token":
+                    yield _sse("llm_token", {"text": value})
+                elif kind == "field":
+                    yield _sse("llm_field", {"key": value[0], "value": value[1]})
+                else:
+                    yield _sse("result", {"ocr_text": ocr_text, "parsed_json": value})
+        except Exception as e:
+            yield _sse("error", {"detail": f"LLM extraction failed: {str(e)}"})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+def _job_view(job):
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "filename": job["filename"],
+        "progress": {"completed_pages": len(job["results"]), "total_pages": job["total_pages"]},
+        "pages": sorted(job["results"], key=lambda page: page["page_num"]),
+        "parsed_json": job["parsed_json"],
+        "error": job["error"],
+    }
+
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+async def create_job(file: UploadFile = File(...), pages: str = "all", extract: bool = True, batch_size: int = 1):
+    """Queue a document for background OCR (and extraction if `extract`); poll GET /jobs/{job_id} for progress."""
+    if not file.filename.lower().endswith((".pdf", ".jpg", ".jpeg", ".png")):
+        raise HTTPException(status_code=400, detail="File must be a PDF or image.")
+    job_id = await run_in_threadpool(job_manager.submit, file.file, file.filename, pages, extract, batch_size)
+    return _job_view(job_manager.get(job_id))
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    job = await run_in_threadpool(job_manager.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return _job_view(job)
+
+@app.delete("/jobs/{job_id}", response_model=JobResponse)
+async def cancel_job(job_id: str):
+    job = await run_in_threadpool(job_manager.cancel, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return _job_view(job)
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, poll_interval: float = 1.0):
+    """Subscribe to a job as Server-Sent Events: a `progress` event whenever it changes, ending with its final state."""
+    if await run_in_threadpool(job_manager.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    async def events():
+        last_updated = None
+        while True:
+            job = await run_in_threadpool(job_manager.get, job_id)
+            if job["updated_at"] != last_updated:
+                last_updated = job["updated_at"]
+                yield _sse("progress", _job_view(job))
+            if job["status"] in TERMINAL_STATUSES:
+                break
+            await asyncio.sleep(max(poll_interval, 0.1))
+
+    return StreamingResponse(events(), media_type="text/event-stream")
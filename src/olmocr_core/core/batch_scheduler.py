@@ -0,0 +1,88 @@
+import asyncio
+import os
+
+# Requests arriving within OCR_BATCH_MAX_WAIT_MS of the first one in a batch share its generate call
+OCR_BATCH_MAX_SIZE = int(os.environ.get("OCR_BATCH_MAX_SIZE", os.environ.get("OCR_MAX_BATCH_SIZE", "4")))
+OCR_BATCH_MAX_WAIT_MS = float(os.environ.get("OCR_BATCH_MAX_WAIT_MS", "15"))
+
+
+class OCRBatchScheduler:
+    """Queues concurrent OCR requests and runs them as batched generations.
+
+    The dispatcher takes the first waiting request, keeps collecting for up to max_wait_ms or until
+    max_batch_size requests are queued, runs them in one call to run_batch on the executor and routes
+    each output back to the request that submitted it. Requests that arrive while a batch is running
+    wait in the queue and form the next batch.
+    """
+
+    def __init__(self, run_batch, executor, max_batch_size=OCR_BATCH_MAX_SIZE, max_wait_ms=OCR_BATCH_MAX_WAIT_MS):
+        self.run_batch = run_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batches_run = 0
+        self.items_run = 0
+        self._queue = None
+        self._dispatcher = None
+
+    def _ensure_started(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._queue = asyncio.Queue()
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def submit(self, image, anchor_text):
+        """Queue one (image, anchor_text) page and wait for its decoded OCR output."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(((image, anchor_text), future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Skip requests whose callers already gave up (e.g. client disconnected)
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+            try:
+                outputs = await loop.run_in_executor(self.executor, self.run_batch, [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches_run += 1
+            self.items_run += len(batch)
+            for (_, future), output in zip(batch, outputs):
+                if not future.done():
+                    future.set_result(output)
+
+    async def stop(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+
+    def stats(self):
+        return {
+            "batches_run": self.batches_run,
+            "items_run": self.items_run,
+            "mean_batch_size": self.items_run / self.batches_run if self.batches_run else 0.0,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+        }
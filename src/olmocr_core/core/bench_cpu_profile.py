@@ -0,0 +1,92 @@
+"""Compare OCR generation speed and memory across model profiles (default bf16 vs the int8 CPU profile).
+
+Each profile runs in its own process so resident memory is measured from a clean start.
+Usage: python bench_cpu_profile.py <file> [--page 1] [--new-tokens 64] [--profiles default,cpu] [--threads 0]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+
+def _rss_mb():
+    # Current resident set size (Linux); peak RSS from getrusage is reported separately
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def _run_worker(args):
+    # OCR_PROFILE is read at import time, so it is set by the parent before this process starts
+    import torch
+
+    from model_manager import ocr_model
+    from ocr import _prepare_ocr_inputs, process_file
+
+    start = time.perf_counter()
+    model, processor, device = ocr_model.get()
+    load_seconds = time.perf_counter() - start
+    image, anchor_text = process_file(args.file, args.page)
+    inputs = _prepare_ocr_inputs([(image, anchor_text)], processor, device)
+    generate_kwargs = dict(max_new_tokens=args.new_tokens, min_new_tokens=args.new_tokens, do_sample=False)
+
+    with torch.inference_mode():
+        # Warm-up (and torch.compile, if enabled) outside the timed run
+        model.generate(**inputs, max_new_tokens=2, do_sample=False)
+        start = time.perf_counter()
+        output = model.generate(**inputs, **generate_kwargs)
+        seconds = time.perf_counter() - start
+    new_tokens = output.shape[1] - inputs["input_ids"].shape[1]
+    print(json.dumps({
+        "profile": ocr_model.profile,
+        "device": str(device),
+        "threads": torch.get_num_threads(),
+        "load_seconds": load_seconds,
+        "prompt_tokens": inputs["input_ids"].shape[1],
+        "new_tokens": new_tokens,
+        "generate_seconds": seconds,
+        "tokens_per_second": new_tokens / seconds,
+        "rss_mb": _rss_mb(),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCR model profiles: tokens/sec and resident memory.")
+    parser.add_argument("file", help="PDF or image file to use as the page")
+    parser.add_argument("--page", type=int, default=1, help="Page number (PDF only)")
+    parser.add_argument("--new-tokens", type=int, default=64, help="Tokens to generate per run")
+    parser.add_argument("--profiles", default="default,cpu", help="Comma-separated OCR_PROFILE values to compare")
+    parser.add_argument("--threads", type=int, default=0, help="OCR_CPU_THREADS for every profile (0 = torch default)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        _run_worker(args)
+        return
+
+    results = []
+    for profile in args.profiles.split(","):
+        env = dict(os.environ, OCR_PROFILE=profile, OCR_CPU_THREADS=str(args.threads))
+        if profile == "default":
+            # Compare against the bf16 path on the same CPU, not against a GPU
+            env["CUDA_VISIBLE_DEVICES"] = ""
+        command = [sys.executable, os.path.abspath(__file__), args.file, "--page", str(args.page),
+                   "--new-tokens", str(args.new_tokens), "--worker"]
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(f"Profile {profile} failed:\n{completed.stderr}")
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(f"{'profile':>8} {'device':>6} {'threads':>7} {'tok/s':>8} {'rss MB':>9} {'peak MB':>9} {'load s':>7}")
+    for result in results:
+        print(f"{result['profile']:>8} {result['device']:>6} {result['threads']:>7} {result['tokens_per_second']:>8.2f} "
+              f"{result['rss_mb']:>9.0f} {result['peak_rss_mb']:>9.0f} {result['load_seconds']:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Compare the "full" and "lean" extraction prompts on the same OCR output: tokens in, tokens out and latency.
+
+Calls Ollama directly (no LLM cache). Usage: python bench_extraction_prompt.py <ocr_output_file> [--runs 3]
+"""
+import argparse
+import json
+import statistics
+import time
+
+from inference import EXTRACTION_PROMPT_MODES, build_extraction_payload, extract_ocr_text
+from ollama_client import ollama, response_content
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark extraction prompt modes against Ollama.")
+    parser.add_argument("ocr_output", help="olmOCR output (JSON) or plain text file")
+    parser.add_argument("--runs", type=int, default=3, help="Requests per mode")
+    args = parser.parse_args()
+
+    with open(args.ocr_output, encoding="utf-8") as f:
+        ocr_text = extract_ocr_text(f.read())
+
+    print(f"{'mode':>5} {'prompt tok':>10} {'output tok':>10} {'latency s':>9} {'valid JSON':>10}")
+    for mode in EXTRACTION_PROMPT_MODES:
+        payload = build_extraction_payload(ocr_text, mode)
+        prompt_tokens, output_tokens, latencies, valid = [], [], [], 0
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            result = ollama.chat(payload)
+            latencies.append(time.perf_counter() - start)
+            prompt_tokens.append(result.get("prompt_eval_count", 0))
+            output_tokens.append(result.get("eval_count", 0))
+            try:
+                json.loads(response_content(result))
+                valid += 1
+            except ValueError:
+                pass
+        # Ollama only evaluates the uncached part of a prompt, so later runs show the prefix-cache effect
+        print(f"{mode:>5} {statistics.median(prompt_tokens):>10.0f} {statistics.median(output_tokens):>10.0f} "
+              f"{statistics.median(latencies):>9.2f} {valid:>7}/{args.runs}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Compare prompt prefill time with and without the cached olmOCR prompt prefix, and check that greedy output is unchanged.
+
+Usage: python bench_prefix_cache.py <file> [--page 1] [--batch-size 1] [--runs 5]
+"""
+import argparse
+import statistics
+import time
+
+import torch
+
+from model_manager import ocr_model
+from ocr import _ocr_prompt_prefix, _prepare_ocr_inputs, process_file
+from prefix_cache import PromptPrefixCache, matches_plain_generate
+
+
+def _timed(func, device):
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    func()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCR prompt prefill with and without the prefix KV cache.")
+    parser.add_argument("file", help="PDF or image file to use as the page")
+    parser.add_argument("--page", type=int, default=1, help="Page number (PDF only)")
+    parser.add_argument("--batch-size", type=int, default=1, help="Copies of the page per batch")
+    parser.add_argument("--runs", type=int, default=5, help="Timed runs per mode (after one warm-up)")
+    parser.add_argument("--check-tokens", type=int, default=16, help="Greedy tokens compared with and without the cache (0 skips)")
+    args = parser.parse_args()
+
+    model, processor, device = ocr_model.get()
+    device = torch.device(device)
+    image, anchor_text = process_file(args.file, args.page)
+    inputs = _prepare_ocr_inputs([(image, anchor_text)] * args.batch_size, processor, device)
+
+    build_seconds = _timed(lambda: PromptPrefixCache(model, processor, device, _ocr_prompt_prefix(processor)), device)
+    prefix_cache = PromptPrefixCache(model, processor, device, _ocr_prompt_prefix(processor))
+
+    def full_prefill():
+        with torch.inference_mode():
+            model(**inputs, use_cache=True)
+
+    def cached_prefill():
+        if prefix_cache.prefill(inputs) is None:
+            raise SystemExit("Prompt does not start with the cached prefix")
+
+    results = {}
+    for name, func in (("full", full_prefill), ("prefix_cached", cached_prefill)):
+        func()
+        results[name] = [_timed(func, device) for _ in range(args.runs)]
+
+    prompt_tokens = int(inputs["attention_mask"][0].sum())
+    print(f"Prompt tokens per page: {prompt_tokens} (cached prefix: {prefix_cache.prefix_length})")
+    print(f"Prefix build (once per model load): {build_seconds * 1000:.1f} ms")
+    for name, seconds in results.items():
+        print(f"{name:>14}: median {statistics.median(seconds) * 1000:.1f} ms, min {min(seconds) * 1000:.1f} ms over {args.runs} runs")
+    saved = statistics.median(results["full"]) - statistics.median(results["prefix_cached"])
+    print(f"Prefill saved per batch: {saved * 1000:.1f} ms ({100 * saved / statistics.median(results['full']):.1f}%)")
+    if args.check_tokens:
+        matches = matches_plain_generate(model, processor, device, inputs, _ocr_prompt_prefix(processor), args.check_tokens)
+        print(f"Greedy output ({args.check_tokens} tokens) matches plain generate: {'yes' if matches else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""Per-stage benchmark of the OCR pipeline that runs offline on CPU.
+
+The OCR model is a tiny, randomly initialized Qwen2-VL with the production processor, prompt and
+generate loop. Its output is noise, but preprocessing, tokenization and decoding cost scale the same
+way. Extraction talks to a local fake Ollama server. For each sample page the suite times:
+process_file (PDF render + anchor text, or image load), prompt building, processor tokenization,
+model.generate and the Ollama round trip. It reports latency percentiles and throughput per stage and
+writes them to JSON. Pass --compare to diff against a results file from another commit.
+
+The processor (OCR_PROCESSOR_ID) must be in the Hugging Face cache; nothing else is downloaded.
+
+Usage: python bench_stages.py [files ...] [--iterations 5] [--output results.json] [--compare old.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+# Random weights never close the JSON object, so cap generation; must be set before ocr.py is imported
+os.environ.setdefault("OCR_MAX_NEW_TOKENS", "32")
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test_ocr_files")
+STAGES = ("process_file", "build_prompt", "tokenize", "generate", "ollama_round_trip")
+
+
+def build_tiny_model(processor, seed=0):
+    """A two-layer Qwen2-VL sharing the processor's vocabulary and special tokens, with random weights."""
+    import torch
+    from transformers import Qwen2VLConfig, Qwen2VLForConditionalGeneration
+
+    torch.manual_seed(seed)
+    tokenizer = processor.tokenizer
+    special_tokens = {
+        "image_token_id": "<|image_pad|>",
+        "video_token_id": "<|video_pad|>",
+        "vision_start_token_id": "<|vision_start|>",
+        "vision_end_token_id": "<|vision_end|>",
+    }
+    config = Qwen2VLConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=64,
+        intermediate_size=128,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        # mrope sections split head_dim / 2 (= 8) between the temporal, height and width axes
+        rope_scaling={"type": "mrope", "mrope_section": [4, 2, 2]},
+        # Patch, merge and temporal sizes must match the image processor
+        vision_config={
+            "depth": 2,
+            "embed_dim": 32,
+            "hidden_size": 64,
+            "num_heads": 2,
+            "mlp_ratio": 2,
+            "patch_size": 14,
+            "spatial_merge_size": 2,
+            "temporal_patch_size": 2,
+            "in_chans": 3,
+        },
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+        **{name: tokenizer.convert_tokens_to_ids(token) for name, token in special_tokens.items()},
+    )
+    return Qwen2VLForConditionalGeneration(config).eval()
+
+
+def _samples(files, pages_per_pdf):
+    from ocr import get_pdf_page_count, is_pdf_file
+
+    if not files:
+        files = sorted(os.path.join(SAMPLE_DIR, name) for name in os.listdir(SAMPLE_DIR))
+    samples = []
+    for path in files:
+        if is_pdf_file(path):
+            samples.extend((path, page_num) for page_num in range(1, min(pages_per_pdf, get_pdf_page_count(path)) + 1))
+        else:
+            samples.append((path, 1))
+    return samples
+
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(timings, tokens):
+    """Latency percentiles (ms) and throughput per stage."""
+    summary = {}
+    for stage in STAGES:
+        seconds = sorted(timings.get(stage, []))
+        if not seconds:
+            continue
+        total = sum(seconds)
+        summary[stage] = {
+            "count": len(seconds),
+            "mean_ms": 1000 * total / len(seconds),
+            "p50_ms": 1000 * _percentile(seconds, 0.50),
+            "p90_ms": 1000 * _percentile(seconds, 0.90),
+            "p99_ms": 1000 * _percentile(seconds, 0.99),
+            "max_ms": 1000 * seconds[-1],
+            "per_second": len(seconds) / total if total else 0.0,
+        }
+    if tokens and timings.get("generate"):
+        summary["generate"]["tokens_per_second"] = sum(tokens) / sum(timings["generate"])
+    return summary
+
+
+def run(args):
+    import torch
+    from transformers import AutoProcessor
+
+    from anchor_cache import anchor_text_cache
+    from fake_ollama import FakeOllamaServer
+    from inference import run_llm_extraction
+    from model_manager import OCR_PROCESSOR_ID, ocr_model
+    from ocr import OCR_GENERATION_KWARGS, build_ocr_messages, is_pdf_file, process_image_file, process_pdf_file
+    from ollama_client import ollama
+
+    torch.set_num_threads(args.threads or torch.get_num_threads())
+    processor = AutoProcessor.from_pretrained(OCR_PROCESSOR_ID)
+    processor.tokenizer.padding_side = "left"
+    device = torch.device("cpu")
+    model = build_tiny_model(processor)
+    ocr_model.use(model, processor, device, model_id="tiny-random-qwen2-vl")
+
+    server = FakeOllamaServer(delay=args.ollama_delay).start()
+    ollama.base_url = server.base_url
+
+    timings = defaultdict(list)
+    tokens = []
+
+    def timed(stage, record, func, *func_args, **func_kwargs):
+        start = time.perf_counter()
+        result = func(*func_args, **func_kwargs)
+        if record:
+            timings[stage].append(time.perf_counter() - start)
+        return result
+
+    samples = _samples(args.files, args.pages)
+    try:
+        for iteration in range(args.warmup + args.iterations):
+            record = iteration >= args.warmup
+            for path, page_num in samples:
+                if is_pdf_file(path):
+                    if not args.warm_anchor_cache:
+                        anchor_text_cache.clear()
+                    image, anchor_text = timed("process_file", record, process_pdf_file, path, page_num, args.dim, args.anchor_len)
+                else:
+                    image, anchor_text = timed("process_file", record, process_image_file, path, args.dim)
+                text = timed(
+                    "build_prompt", record,
+                    lambda: processor.apply_chat_template(build_ocr_messages(anchor_text), tokenize=False, add_generation_prompt=True),
+                )
+                inputs = timed(
+                    "tokenize", record,
+                    lambda: {key: value.to(device) for key, value in processor(text=[text], images=[image], padding=True, return_tensors="pt").items()},
+                )
+                with torch.inference_mode():
+                    output = timed("generate", record, model.generate, **inputs, **OCR_GENERATION_KWARGS)
+                if record:
+                    tokens.append(output.shape[1] - inputs["input_ids"].shape[1])
+                # The random model's output is noise; extraction gets the page's own text layer instead
+                timed("ollama_round_trip", record, run_llm_extraction, anchor_text, use_cache=False)
+    finally:
+        server.stop()
+    return summarize(timings, tokens), len(samples)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_summary(stages, baseline=None):
+    header = f"{'stage':>18} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'per s':>8}"
+    if baseline:
+        header += f" {'p50 vs base':>12}"
+    print(header)
+    for stage, stats in stages.items():
+        line = (f"{stage:>18} {stats['p50_ms']:>9.1f} {stats['p90_ms']:>9.1f} {stats['p99_ms']:>9.1f} "
+                f"{stats['mean_ms']:>9.1f} {stats['per_second']:>8.1f}")
+        base = (baseline or {}).get(stage)
+        if base:
+            line += f" {100 * (stats['p50_ms'] - base['p50_ms']) / base['p50_ms']:>+11.1f}%"
+        print(line)
+    if "tokens_per_second" in stages.get("generate", {}):
+        print(f"generate throughput: {stages['generate']['tokens_per_second']:.1f} tokens/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline per-stage benchmark with a tiny random Qwen2-VL and a fake Ollama.")
+    parser.add_argument("files", nargs="*", help="PDFs/images to use (default: test_ocr_files)")
+    parser.add_argument("--pages", type=int, default=1, help="Pages per PDF")
+    parser.add_argument("--iterations", type=int, default=5, help="Timed passes over the samples")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed passes first")
+    parser.add_argument("--dim", type=int, default=1024, help="Longest image side")
+    parser.add_argument("--anchor-len", type=int, default=4000, help="Anchor text length")
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0 = default)")
+    parser.add_argument("--ollama-delay", type=float, default=0.0, help="Fake Ollama response delay in seconds")
+    parser.add_argument("--warm-anchor-cache", action="store_true", help="Keep parsed PDFs between iterations")
+    parser.add_argument("--output", help="Results file (default: bench_stages_<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare p50 latencies against")
+    args = parser.parse_args()
+
+    stages, num_samples = run(args)
+    commit = _git_commit()
+    results = {
+        "commit": commit,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "samples": num_samples,
+            "iterations": args.iterations,
+            "dim": args.dim,
+            "anchor_len": args.anchor_len,
+            "max_new_tokens": int(os.environ["OCR_MAX_NEW_TOKENS"]),
+            "ollama_delay": args.ollama_delay,
+            "warm_anchor_cache": args.warm_anchor_cache,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "stages": stages,
+    }
+    output = args.output or f"bench_stages_{commit or 'local'}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["stages"]
+    print_summary(stages, baseline)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe in-memory cache that evicts the least recently used entry once max_entries is reached.
+
+    With ttl_seconds set, entries older than the TTL are treated as missing and dropped on lookup.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            value, stored_at = self._data[key]
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DiskCache:
+    """Text cache stored as one file per key, evicting the least recently used files above max_bytes.
+
+    Several processes (uvicorn workers, render workers) may share the directory, so the size kept here
+    only counts this process's writes. It is re-read from the directory at least every rescan_seconds,
+    and whenever it passes max_bytes, before anything is evicted.
+    """
+
+    rescan_seconds = 30
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._stat_entries())
+        self._scanned_at = time.monotonic()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.txt")
+
+    def _entries(self):
+        return [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(".txt")
+        ]
+
+    def _stat_entries(self):
+        """(mtime, size, path) per entry, skipping files another process removed in the meantime."""
+        stats = []
+        for path in self._entries():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stats.append((stat.st_mtime, stat.st_size, path))
+        return stats
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = f.read()
+            # Touch the file so eviction treats it as recently used
+            os.utime(path)
+            return value
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, value):
+        path = self._path(key)
+        data = value.encode("utf-8")
+        with self._lock:
+            # Write to a uniquely named temp file first so readers never see a half-written entry
+            with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False) as f:
+                f.write(data)
+            try:
+                os.replace(f.name, path)
+            except OSError:
+                os.remove(f.name)
+                raise
+            self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes or time.monotonic() - self._scanned_at > self.rescan_seconds:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._stat_entries())
+        self._total_bytes = sum(size for _, size, _ in entries)
+        self._scanned_at = time.monotonic()
+        for _, size, path in entries:
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._total_bytes -= size
+
+    def size_bytes(self):
+        return self._total_bytes
+
+
+class TieredCache:
+    """In-memory LRU in front of an optional on-disk tier, with hit/miss counters."""
+
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+        # Lookups come from the OCR executor and request threads at once; += on an attribute is not atomic
+        self._stats_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self._count("disk_hits")
+                # Promote to memory so the next lookup skips the disk read
+                self.memory.put(key, value)
+                return value
+        self._count("misses")
+        return None
+
+    def _count(self, counter):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def stats(self):
+        with self._stats_lock:
+            memory_hits, disk_hits, misses = self.memory_hits, self.disk_hits, self.misses
+        lookups = memory_hits + disk_hits + misses
+        return {
+            "memory_hits": memory_hits,
+            "disk_hits": disk_hits,
+            "misses": misses,
+            "hit_rate": (memory_hits + disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "disk_bytes": self.disk.size_bytes() if self.disk is not None else 0,
+        }
@@ -0,0 +1,164 @@
+import calendar
+import json
+import os
+import re
+
+# Set ENTITY_RULES_ENABLED=0 to send every entity question to the LLM
+ENTITY_RULES_ENABLED = os.environ.get("ENTITY_RULES_ENABLED", "1") == "1"
+
+# Entity types the rules find exhaustively; the LLM is never asked for these. Every other type goes to
+# the LLM, and rule matches are only added to its answer (dates come in too many formats, names and
+# addresses are only found next to a label).
+RULE_COMPLETE_TYPES = ("emails",)
+
+_MONTH = (
+    r"(?:Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|June?|July?|Aug(?:ust)?"
+    r"|Sep(?:t(?:ember)?)?|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?)"
+)
+
+EMAIL_PATTERN = re.compile(r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b")
+# Candidates only: _valid_date checks the day and month numbers of each match
+DATE_PATTERN = re.compile(
+    r"\b(?:"
+    r"(?P<iso_year>\d{4})[-/.](?P<iso_month>\d{1,2})[-/.](?P<iso_day>\d{1,2})"  # 2023-07-10, 2024/03/15
+    r"|(?P<first>\d{1,2})[/.-](?P<second>\d{1,2})[/.-](?:\d{4}|\d{2})"  # 01/15/2023, 15.01.23
+    rf"|(?P<month_first>{_MONTH})\.?\s+(?P<month_day>\d{{1,2}})(?:st|nd|rd|th)?(?:,?\s+\d{{4}})?"  # March 5, 2022; July 6th
+    rf"|(?P<day_month>\d{{1,2}})(?:st|nd|rd|th)?\s+(?P<month_second>{_MONTH})\.?(?:,?\s+(?:\d{{4}}|\d{{2}}))?"  # 5 March 2022; 06 Jul 25
+    r")\b"
+)
+_PHONE_NUMBER = r"(?:\+\d{1,3}[\s.-]?)?(?:\(\d{1,4}\)[\s.-]?)?\d{2,5}(?:[\s.-]\d{2,5}){1,4}"
+# Unlabeled numbers only count when they look like phone numbers: international or North American format
+PHONE_PATTERN = re.compile(
+    r"(?<![\w+])(?:\+\d{1,3}[\s.-]?(?:\(\d{1,4}\)[\s.-]?)?\d{1,5}(?:[\s.-]\d{2,5}){1,4}"
+    r"|\(\d{3}\)\s?\d{3}[\s.-]\d{4}"
+    r"|\d{3}[.-]\d{3}[.-]\d{4})(?!\w)"
+)
+LABELED_PHONE_PATTERN = re.compile(
+    rf"\b(?:phone|tel|telephone|mobile|cell|fax|contact)(?:\s*(?:no\.?|number|#))?\s*[:.]\s*({_PHONE_NUMBER})",
+    re.IGNORECASE,
+)
+LABELED_ADDRESS_PATTERN = re.compile(
+    r"^[ \t]*(?:[-*•][ \t]+)?(?:(?:shipping|billing|mailing|delivery|home|office|business|postal|street)[ \t]+)?"
+    r"address[ \t]*:[ \t]*(.+)$",
+    re.IGNORECASE | re.MULTILINE,
+)
+LABELED_NAME_PATTERN = re.compile(
+    r"^[ \t]*(?:[-*•][ \t]+)?(?:full[ \t]+name|customer[ \t]+name|name|bill[ \t]+to|ship[ \t]+to|attn|attention|contact[ \t]+person)"
+    r"[ \t]*:[ \t]*(.+)$",
+    re.IGNORECASE | re.MULTILINE,
+)
+# An address often continues on the next line with the city / postal code
+_ADDRESS_CONTINUATION = re.compile(r"^[ \t]*([^:\n]{2,80}(?:\b\d{4,6}\b|\b[A-Z]{1,2}\d[A-Z\d]? ?\d[A-Z]{2}\b)[^:\n]*)$")
+
+
+def _dedup(values):
+    seen = set()
+    result = []
+    for value in values:
+        key = " ".join(value.split()).casefold() if isinstance(value, str) else json.dumps(value, sort_keys=True)
+        if key and key not in seen:
+            seen.add(key)
+            result.append(value)
+    return result
+
+
+_MONTH_NUMBERS = {
+    name: number
+    for number, name in enumerate(("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"), start=1)
+}
+
+
+def _month_day_ok(month, day):
+    # 2000 is a leap year, so 29 February passes
+    return 1 <= month <= 12 and 1 <= day <= calendar.monthrange(2000, month)[1]
+
+
+def _valid_date(match):
+    if match.group("iso_year"):
+        return _month_day_ok(int(match.group("iso_month")), int(match.group("iso_day")))
+    if match.group("first"):
+        first, second = int(match.group("first")), int(match.group("second"))
+        # Either MM/DD or DD/MM
+        return _month_day_ok(first, second) or _month_day_ok(second, first)
+    month = _MONTH_NUMBERS[(match.group("month_first") or match.group("month_second"))[:3]]
+    return _month_day_ok(month, int(match.group("month_day") or match.group("day_month")))
+
+
+# Words a labeled value may contain that are not capitalized, and words a person name cannot start with
+_NAME_PARTICLES = {"van", "von", "de", "der", "den", "da", "di", "del", "della", "la", "le", "du", "bin", "ibn", "al"}
+_NOT_NAME_START = {"the", "a", "an", "this", "our", "your"}
+
+
+def _looks_like_person_name(value):
+    words = value.split()
+    if not 1 <= len(words) <= 5 or words[0].casefold() in _NOT_NAME_START:
+        return False
+    return all(word[0].isupper() or word.casefold() in _NAME_PARTICLES for word in words)
+
+
+def _phone_digits_ok(number):
+    digits = sum(char.isdigit() for char in number)
+    return 7 <= digits <= 15
+
+
+def _labeled_addresses(text):
+    addresses = []
+    for match in LABELED_ADDRESS_PATTERN.finditer(text):
+        address = match.group(1).strip()
+        # Pick up to two continuation lines (city, postal code) that are not themselves labels
+        rest = text[match.end():].split("\n", 3)[1:3]
+        for line in rest:
+            continuation = _ADDRESS_CONTINUATION.match(line)
+            if continuation is None:
+                break
+            address = f"{address}, {continuation.group(1).strip()}"
+        addresses.append(address.rstrip(" ,"))
+    return addresses
+
+
+def _labeled_names(text):
+    names = []
+    for match in LABELED_NAME_PATTERN.finditer(text):
+        name = EMAIL_PATTERN.sub("", match.group(1)).replace("<>", "").strip(" ,;")
+        if name and len(name) <= 60 and not any(char.isdigit() for char in name) and _looks_like_person_name(name):
+            names.append(name)
+    return names
+
+
+def extract_entities(text):
+    """Find emails, phone numbers, dates and labeled names/addresses with precompiled patterns.
+
+    Returns the same keys as the LLM's "entities" block; organizations are left to the LLM. Only the
+    emails are complete; the other lists are partial and meant to be merged into the LLM's answer.
+    """
+    # olmOCR emits Markdown, where labels are often bold ("**Email:** ...")
+    text = text.replace("**", "").replace("__", "")
+    phones = [number.strip() for number in PHONE_PATTERN.findall(text)]
+    phones += [number.strip() for number in LABELED_PHONE_PATTERN.findall(text)]
+    return {
+        "names": _dedup(_labeled_names(text)),
+        "emails": _dedup(EMAIL_PATTERN.findall(text)),
+        "phone_numbers": _dedup(number for number in phones if _phone_digits_ok(number)),
+        "dates": _dedup(match.group(0) for match in DATE_PATTERN.finditer(text) if _valid_date(match)),
+        "organizations": [],
+        "addresses": _dedup(_labeled_addresses(text)),
+    }
+
+
+def types_needing_llm(wanted):
+    """Entity types in `wanted` the rules cannot settle on their own (all but RULE_COMPLETE_TYPES).
+
+    An empty result means the LLM call can be skipped.
+    """
+    return [entity_type for entity_type in wanted if entity_type not in RULE_COMPLETE_TYPES]
+
+
+def merge_entities(rule_entities, llm_entities):
+    """Combine rule and LLM entities per type, rule values first, without duplicates."""
+    merged = dict(llm_entities) if isinstance(llm_entities, dict) else {}
+    for entity_type, values in rule_entities.items():
+        llm_values = merged.get(entity_type) or []
+        if not isinstance(llm_values, list):
+            llm_values = [llm_values]
+        merged[entity_type] = _dedup(values + llm_values)
+    return merged
@@ -0,0 +1,139 @@
+import json
+import os
+import re
+
+# Documents longer than this (estimated tokens of OCR text) are extracted in chunks of at most this size
+EXTRACTION_CHUNK_TOKENS = int(os.environ.get("EXTRACTION_CHUNK_TOKENS", "3000"))
+# Rough characters per token for OCR text; the Ollama model's tokenizer is not available locally
+CHARS_PER_TOKEN = 4
+
+ENTITY_KEYS = ("names", "emails", "phone_numbers", "dates", "organizations", "addresses")
+
+_HEADING = re.compile(r"\n(?=#{1,6} )")
+_PARAGRAPH = re.compile(r"\n\s*\n")
+_LINE = re.compile(r"\n")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+_HEADING_ONLY = re.compile(r"#{1,6} [^\n]*")
+
+
+def estimate_tokens(text):
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _split_unit(text, max_tokens):
+    """Split one oversized piece at the coarsest boundary that works: headings, paragraphs, lines, sentences, characters."""
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    for pattern in (_HEADING, _PARAGRAPH, _LINE, _SENTENCE):
+        parts = [part for part in pattern.split(text) if part.strip()]
+        if len(parts) > 1:
+            return [piece for part in parts for piece in _split_unit(part, max_tokens)]
+    return _split_words(text, max_tokens * CHARS_PER_TOKEN)
+
+
+def _split_words(text, max_chars):
+    """Cut text into pieces of at most max_chars at the last whitespace before the limit (mid-word only for a single overlong word)."""
+    pieces = []
+    while len(text) > max_chars:
+        cut = max(text.rfind(" ", 0, max_chars + 1), text.rfind("\n", 0, max_chars + 1))
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(text[:cut])
+        text = text[cut:].lstrip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+def split_into_chunks(pages, max_tokens=EXTRACTION_CHUNK_TOKENS):
+    """Pack page texts into chunks of at most max_tokens (estimated), in order.
+
+    Whole pages are kept together where they fit; a page that is too large on its own is split at
+    section headings, then paragraphs, lines, sentences and words. A heading never ends a chunk: it
+    moves to the next chunk with the section it introduces.
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+    for page in pages:
+        for unit in _split_unit(page, max_tokens):
+            unit_tokens = estimate_tokens(unit)
+            if current and current_tokens + unit_tokens > max_tokens:
+                carried = []
+                while current and _HEADING_ONLY.fullmatch(current[-1].strip()):
+                    carried.insert(0, current.pop())
+                if current:
+                    chunks.append("\n\n".join(current))
+                current, current_tokens = carried, sum(estimate_tokens(heading) for heading in carried)
+            current.append(unit)
+            current_tokens += unit_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _dedup_key(value):
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    return json.dumps(value, sort_keys=True)
+
+
+def _normalized_headers(table):
+    return [_dedup_key(header) for header in table.get("headers") or []]
+
+
+def _continues(previous, table):
+    """Whether a chunk's first table is the continuation of the previous chunk's last table."""
+    headers = _normalized_headers(table)
+    if headers:
+        return headers == _normalized_headers(previous)
+    # A table split mid-way often comes back without headers; match it on column count instead
+    rows = table.get("rows") or []
+    width = len(previous.get("headers") or (previous.get("rows") or [[]])[0])
+    return bool(rows) and all(len(row) == width for row in rows)
+
+
+def merge_extractions(results, full_text):
+    """Merge per-chunk extraction results (in document order) into one parsed_json.
+
+    Entities are concatenated and deduplicated (case and whitespace insensitive). A chunk's first table
+    continues the previous chunk's last table when their headers match. For form fields, the first
+    non-empty value wins. Document sections are concatenated.
+    """
+    entities = {key: [] for key in ENTITY_KEYS}
+    seen = {}
+    tables = []
+    form_fields = {}
+    sections = []
+    for result in results:
+        if not isinstance(result, dict):
+            continue
+        for key, values in (result.get("entities") or {}).items():
+            if not isinstance(values, list):
+                values = [values]
+            bucket = entities.setdefault(key, [])
+            keys = seen.setdefault(key, set())
+            for value in values:
+                if value in (None, "") or _dedup_key(value) in keys:
+                    continue
+                keys.add(_dedup_key(value))
+                bucket.append(value)
+        for index, table in enumerate(result.get("tables") or []):
+            if not isinstance(table, dict):
+                continue
+            if index == 0 and tables and _continues(tables[-1], table):
+                tables[-1]["rows"] = (tables[-1].get("rows") or []) + (table.get("rows") or [])
+            else:
+                tables.append({"headers": table.get("headers") or [], "rows": list(table.get("rows") or [])})
+        for field, value in (result.get("form_fields") or {}).items():
+            if value not in (None, "") and form_fields.get(field) in (None, ""):
+                form_fields[field] = value
+        structure = result.get("document_structure") or {}
+        sections.extend(structure.get("sections") or [])
+    return {
+        "entities": entities,
+        "tables": tables,
+        "form_fields": form_fields,
+        "document_structure": {"sections": sections},
+        "full_text": full_text,
+    }
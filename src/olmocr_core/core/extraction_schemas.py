@@ -0,0 +1,100 @@
+import json
+from typing import Dict, List, Optional, Union
+
+from pydantic import BaseModel, Field, ValidationError
+
+from json_stream import parse_partial_json
+from metrics import record_error, time_stage
+
+# Output schemas for the Ollama extraction calls. Each is sent as the request's "format" so Ollama
+# constrains decoding to it, and the same model validates the response.
+
+
+class ExtractionOutputError(ValueError):
+    """The model's output could not be parsed, or parsed but did not match the schema."""
+
+
+class Entities(BaseModel):
+    names: List[str] = []
+    emails: List[str] = []
+    phone_numbers: List[str] = []
+    dates: List[str] = []
+    organizations: List[str] = []
+    addresses: List[str] = []
+
+
+class Table(BaseModel):
+    headers: List[str] = []
+    rows: List[List[str]] = []
+
+
+class Section(BaseModel):
+    heading: str = ""
+    content: Optional[str] = None
+    table: Optional[Table] = None
+
+
+class DocumentStructure(BaseModel):
+    sections: List[Section] = []
+
+
+class ExtractionResult(BaseModel):
+    """run_llm_extraction's parsed_json (lean prompt: full_text is added after validation)."""
+
+    entities: Entities = Field(default_factory=Entities)
+    tables: List[Table] = []
+    # Checkboxes come back as booleans
+    form_fields: Dict[str, Union[str, bool]] = {}
+    document_structure: DocumentStructure = Field(default_factory=DocumentStructure)
+
+
+class FullExtractionResult(ExtractionResult):
+    """The original prompt also has the model copy the input into full_text."""
+
+    full_text: str = ""
+
+
+def response_format(model):
+    """JSON schema for Ollama's structured-output "format" parameter, with every field required."""
+    schema = model.model_json_schema()
+    # Required fields keep the model from skipping a key; defaults only matter when validating
+    for definition in [schema, *schema.get("$defs", {}).values()]:
+        if "properties" in definition:
+            definition["required"] = list(definition["properties"])
+    return schema
+
+
+def entities_format(entity_types):
+    """Entities' schema restricted to entity_types (the entity call asks only for what the rules missed)."""
+    schema = response_format(Entities)
+    schema["properties"] = {entity_type: schema["properties"][entity_type] for entity_type in entity_types}
+    schema["required"] = list(entity_types)
+    return schema
+
+
+def validate_json(model, content):
+    """Parse and validate a JSON response against model; returns a plain dict (unset optional fields dropped)."""
+    return model.model_validate_json(content).model_dump(exclude_none=True)
+
+
+def validate_partial_json(model, content):
+    """validate_json, but output truncated mid-generation is repaired first and validated for what it holds.
+
+    Missing fields take their defaults. Raises ExtractionOutputError if nothing usable can be recovered
+    or the (complete or repaired) JSON does not match the schema.
+    """
+    with time_stage("json_parse"):
+        try:
+            data = json.loads(content)
+        except ValueError:
+            data = parse_partial_json(content)
+            if not isinstance(data, dict):
+                record_error("json_parse")
+                raise ExtractionOutputError(f"{model.__name__} output is not valid JSON") from None
+            print(f"Incomplete {model.__name__} output; using the fields completed before it was cut off")
+            record_error("truncated_output")
+        try:
+            return model.model_validate(data).model_dump(exclude_none=True)
+        except ValidationError as e:
+            record_error("schema")
+            raise ExtractionOutputError(f"{model.__name__} output does not match the schema: {e}") from e
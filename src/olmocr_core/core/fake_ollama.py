@@ -0,0 +1,103 @@
+"""A local stand-in for Ollama's /api/chat, for benchmarks and offline runs.
+
+Answers every chat request with a fixed, schema-conformant extraction result (streamed as NDJSON when
+"stream" is true) after an optional delay, and reports token counters like Ollama does.
+
+Usage: python fake_ollama.py [--port 11435] [--delay 0]
+Then:  OLLAMA_BASE_URL=http://localhost:11435 uvicorn api:app
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_EXTRACTION = {
+    "entities": {
+        "names": ["John Doe"],
+        "emails": ["johndoe@example.com"],
+        "phone_numbers": ["+1-555-123-4567"],
+        "dates": ["2025-07-06"],
+        "organizations": ["Springfield Books"],
+        "addresses": ["123 Main Street, Springfield, USA"],
+    },
+    "tables": [{"headers": ["Book Title", "Price"], "rows": [["1984", "$10"], ["Brave New World", "$12"]]}],
+    "form_fields": {"Name": "John Doe"},
+    "document_structure": {"sections": [{"heading": "Book Order Letter", "content": "Dear Bookstore, ..."}]},
+}
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+    # HTTP/1.1 keeps connections alive, like Ollama, so pooled clients are measured realistically
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if self.path != "/api/chat":
+            self._send(404, b'{"error": "not found"}')
+            return
+        time.sleep(self.delay)
+        content = json.dumps(FAKE_EXTRACTION)
+        prompt_chars = sum(len(message.get("content", "")) for message in payload.get("messages", []))
+        counters = {"prompt_eval_count": prompt_chars // 4, "eval_count": len(content) // 4, "done": True}
+        model = payload.get("model", "fake")
+        if payload.get("stream"):
+            lines = [
+                json.dumps({"model": model, "message": {"role": "assistant", "content": content[start:start + 32]}, "done": False})
+                for start in range(0, len(content), 32)
+            ]
+            lines.append(json.dumps({"model": model, "message": {"role": "assistant", "content": ""}, **counters}))
+            self._send(200, ("\n".join(lines) + "\n").encode("utf-8"), "application/x-ndjson")
+        else:
+            body = {"model": model, "message": {"role": "assistant", "content": content}, **counters}
+            self._send(200, json.dumps(body).encode("utf-8"))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeOllamaServer:
+    """Runs FakeOllamaHandler on a background thread; port 0 picks a free port."""
+
+    def __init__(self, host="127.0.0.1", port=0, delay=0.0):
+        handler = type("Handler", (FakeOllamaHandler,), {"delay": delay})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama /api/chat server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before answering")
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(args.host, args.port, args.delay)
+    print(f"Fake Ollama listening on {server.base_url}")
+    server.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,50 @@
-import requests
+import asyncio
 import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-def run_llm_extraction(ocr_output_file, parsed_output_file):
-    OLLAMA_BASE_URL = "http://localhost:11434"
-    OLLAMA_MODEL = "qwen2.5vl:7b"
-    # Read and parse the OCR output as JSON
-    with open(ocr_output_file, "r", encoding="utf-8") as f:
-        ocr_content = f.read()
+from entity_rules import ENTITY_RULES_ENABLED, extract_entities, merge_entities
+from extraction_schemas import ExtractionResult, FullExtractionResult, response_format, validate_json, validate_partial_json
+from json_stream import IncrementalJSONParser, parse_partial_json
+from extraction_chunks import EXTRACTION_CHUNK_TOKENS, estimate_tokens, merge_extractions, split_into_chunks
+from llm_cache import LLM_CACHE_ENABLED, llm_cache_key, llm_result_cache
+from metrics import time_stage
+from ollama_client import ollama, response_content
+
+# Bump whenever the extraction prompts below change so cached results from the old prompt are not reused
+EXTRACTION_PROMPT_VERSION = "3"
+
+# "lean": static instructions first (so Ollama can reuse their KV cache across requests), the OCR text
+# once, and full_text filled in here instead of generated. "full": the original prompt, which embeds the
+# OCR text twice and has the model copy it into full_text.
+EXTRACTION_PROMPT_MODE = os.environ.get("EXTRACTION_PROMPT_MODE", "lean")
+EXTRACTION_PROMPT_MODES = ("lean", "full")
+# Set EXTRACTION_CHUNKING=0 to always send the whole document in one prompt
+EXTRACTION_CHUNKING = os.environ.get("EXTRACTION_CHUNKING", "1") == "1"
+EXTRACTION_OPTIONS = {
+    "temperature": 0.1,
+    "num_predict": 1500
+}
+
+def extract_ocr_text(ocr_content):
+    """Return the natural_text of an olmOCR JSON response, or the content itself if it is plain text.
+
+    Output cut off mid-generation still yields the natural_text produced up to that point.
+    """
+    with time_stage("json_parse"):
         try:
             ocr_json = json.loads(ocr_content)
-            ocr_text = ocr_json.get("natural_text", "")
+            return ocr_json.get("natural_text", "")
         except Exception:
+            salvaged = parse_partial_json(ocr_content)
+            if isinstance(salvaged, dict) and isinstance(salvaged.get("natural_text"), str):
+                return salvaged["natural_text"]
             # Fallback: treat as plain text if not JSON
-            ocr_json = None
-            ocr_text = ocr_content
+            return ocr_content
+
+def _full_prompt(ocr_text):
     prompt = f"""
 You are an expert document parser. Analyze ONLY the OCR text provided below 'Text to analyze:' and extract the following in valid JSON:
 
@@ -75,30 +106,256 @@ Text to analyze:
 {ocr_text}
 Output:
 """
-    messages = [
-        {"role": "user", "content": prompt}
+    return prompt
+
+LEAN_EXTRACTION_INSTRUCTIONS = """
+You are an expert document parser. Analyze ONLY the OCR text in the user's message and extract the following in valid JSON:
+
+- Entities such as: Names, emails, phone numbers, dates, organizations, amounts, addresses, etc.
+- Tables: Rows and columns of data in structured format
+- Form Fields: Field-value pairs like "Name: John Doe", checkboxes
+- Document Structure: Headings, paragraphs, bullet points, sectioned content
+
+Below is an EXAMPLE for illustration only. DO NOT extract data from this example.
+
+Format:
+{
+  "entities": {
+    "names": [],
+    "emails": [],
+    "phone_numbers": [],
+    "dates": [],
+    "organizations": [],
+    "addresses": []
+  },
+  "tables": [
+    {
+      "headers": ["Book Title", "Author", "Price"],
+      "rows": [
+        ["1984", "George Orwell", "$10"],
+        ["Brave New World", "Aldous Huxley", "$12"]
+      ]
+    }
+  ],
+  "form_fields": {
+    "Name": "Anuj Kumar",
+    "Gender": "Male",
+    "Address": "123 Main Street, Mumbai",
+    "Phone": "+91-98765-43210"
+  },
+  "document_structure": {
+    "sections": [
+      {
+        "heading": "1. Introduction",
+        "content": "This document outlines..."
+      },
+      {
+        "heading": "2. Order Details",
+        "table": {
+          "headers": ["Book Title", "Price"],
+          "rows": [["Deep Learning with Python", "$45"]]
+        }
+      }
     ]
-    payload = {
-        "model": OLLAMA_MODEL,
+  }
+}
+
+Do not repeat the input text in the output. Output only the JSON object.
+"""
+
+def build_extraction_payload(ocr_text, mode=None):
+    """Build the Ollama chat payload for the structured-extraction prompt in the given (or configured) mode."""
+    mode = mode or EXTRACTION_PROMPT_MODE
+    if mode == "full":
+        messages = [
+            {"role": "user", "content": _full_prompt(ocr_text)}
+        ]
+    elif mode == "lean":
+        # The system message is byte-identical across requests, so it stays a cacheable prefix
+        messages = [
+            {"role": "system", "content": LEAN_EXTRACTION_INSTRUCTIONS},
+            {"role": "user", "content": f"Text to analyze:\n{ocr_text}"}
+        ]
+    else:
+        raise ValueError(f"Unknown extraction prompt mode {mode!r}; expected one of {', '.join(EXTRACTION_PROMPT_MODES)}")
+    return {
+        "model": ollama.model,
         "messages": messages,
         "stream": False,
-        "options": {
-            "temperature": 0.1,
-            "num_predict": 1500
-        }
+        # Ollama constrains decoding to this JSON schema, so the answer always parses
+        "format": response_format(_result_model(mode)),
+        "options": dict(EXTRACTION_OPTIONS)
     }
+
+class ExtractionStats:
+    """Token counts and latency of extraction calls per prompt mode, from Ollama's response counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modes = {}
+
+    def record(self, mode, result, seconds):
+        with self._lock:
+            stats = self._modes.setdefault(mode, {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_seconds": 0.0})
+            stats["requests"] += 1
+            stats["prompt_tokens"] += result.get("prompt_eval_count", 0)
+            stats["completion_tokens"] += result.get("eval_count", 0)
+            stats["total_seconds"] += seconds
+
+    def stats(self):
+        with self._lock:
+            return {
+                mode: {
+                    **stats,
+                    "mean_prompt_tokens": stats["prompt_tokens"] / stats["requests"],
+                    "mean_completion_tokens": stats["completion_tokens"] / stats["requests"],
+                    "mean_seconds": stats["total_seconds"] / stats["requests"],
+                }
+                for mode, stats in self._modes.items()
+            }
+
+extraction_stats = ExtractionStats()
+
+def _extraction_cache_key(payload, ocr_text, mode):
+    return llm_cache_key(f"extraction-{mode}", EXTRACTION_PROMPT_VERSION, payload["model"], payload["options"], ocr_text)
+
+def _result_model(mode):
+    return FullExtractionResult if mode == "full" else ExtractionResult
+
+def _store_if_valid(cache_key, content, mode):
+    try:
+        validate_json(_result_model(mode), content)
+        llm_result_cache.put(cache_key, content)
+    except ValueError:
+        pass  # Don't replay a malformed answer on retry
+
+def _parse_extraction(content, ocr_text, mode):
+    """Validate the model's answer against the extraction schema (raises ExtractionOutputError if it does not match).
+
+    An answer cut off by num_predict is salvaged: the fields completed before the cut are kept.
+    """
+    parsed_json = validate_partial_json(_result_model(mode), content)
+    if mode == "lean":
+        # The lean prompt does not ask the model to copy the input back
+        parsed_json["full_text"] = ocr_text
+    if ENTITY_RULES_ENABLED:
+        # Pattern matches are exact, so they fill in whatever the model missed or misspelled
+        parsed_json["entities"] = merge_entities(extract_entities(ocr_text), parsed_json.get("entities"))
+    return parsed_json
+
+def _ocr_pages(ocr_content):
+    """OCR output as a list of page texts; ocr_content is one page's output or a list of them."""
+    if isinstance(ocr_content, (list, tuple)):
+        return [extract_ocr_text(page) for page in ocr_content]
+    return [extract_ocr_text(ocr_content)]
+
+def _needs_chunking(ocr_text):
+    return EXTRACTION_CHUNKING and estimate_tokens(ocr_text) > EXTRACTION_CHUNK_TOKENS
+
+def _prepare_extraction(ocr_text, use_cache, mode):
+    """Return (payload, cache_key or None, cached content or None)."""
+    payload = build_extraction_payload(ocr_text, mode)
+    cache_key = cached = None
+    if use_cache and LLM_CACHE_ENABLED:
+        cache_key = _extraction_cache_key(payload, ocr_text, mode)
+        cached = llm_result_cache.get(cache_key)
+    return payload, cache_key, cached
+
+def _extract_text(ocr_text, use_cache, mode):
+    payload, cache_key, cached = _prepare_extraction(ocr_text, use_cache, mode)
+    if cached is not None:
+        return _parse_extraction(cached, ocr_text, mode)
+    start = time.perf_counter()
+    result = ollama.chat(payload)
+    extraction_stats.record(mode, result, time.perf_counter() - start)
+    content = response_content(result)
+    if cache_key is not None:
+        _store_if_valid(cache_key, content, mode)
+    return _parse_extraction(content, ocr_text, mode)
+
+async def _extract_text_async(ocr_text, use_cache, mode):
+    payload, cache_key, cached = _prepare_extraction(ocr_text, use_cache, mode)
+    if cached is not None:
+        return _parse_extraction(cached, ocr_text, mode)
+    start = time.perf_counter()
+    result = await ollama.chat_async(payload)
+    extraction_stats.record(mode, result, time.perf_counter() - start)
+    content = response_content(result)
+    if cache_key is not None:
+        _store_if_valid(cache_key, content, mode)
+    return _parse_extraction(content, ocr_text, mode)
+
+def run_llm_extraction(ocr_content, use_cache=True, mode=None):
+    """Run structured extraction on OCR output (olmOCR JSON or plain text) and return the parsed JSON.
+
+    ocr_content may also be a list of page outputs. Text longer than EXTRACTION_CHUNK_TOKENS is split
+    on page/section boundaries, the chunks are extracted concurrently and their results merged.
+    """
+    mode = mode or EXTRACTION_PROMPT_MODE
+    pages = _ocr_pages(ocr_content)
+    ocr_text = "\n\n".join(pages)
+    if not _needs_chunking(ocr_text):
+        return _extract_text(ocr_text, use_cache, mode)
+    chunks = split_into_chunks(pages)
+    # The Ollama client caps requests in flight at its num_parallel, so more threads would only wait
+    with ThreadPoolExecutor(max_workers=min(len(chunks), ollama.num_parallel)) as pool:
+        results = list(pool.map(lambda chunk: _extract_text(chunk, use_cache, mode), chunks))
+    return merge_extractions(results, ocr_text)
+
+async def run_llm_extraction_async(ocr_content, use_cache=True, mode=None):
+    """Async variant of run_llm_extraction for the API's event loop."""
+    mode = mode or EXTRACTION_PROMPT_MODE
+    pages = _ocr_pages(ocr_content)
+    ocr_text = "\n\n".join(pages)
+    if not _needs_chunking(ocr_text):
+        return await _extract_text_async(ocr_text, use_cache, mode)
+    chunks = split_into_chunks(pages)
+    results = await asyncio.gather(*(_extract_text_async(chunk, use_cache, mode) for chunk in chunks))
+    return merge_extractions(results, ocr_text)
+
+async def stream_llm_extraction_async(ocr_content, use_cache=True, mode=None):
+    """Streaming variant of run_llm_extraction_async.
+
+    Yields ("token", text) for each chunk Ollama generates, ("field", (key, value)) as soon as a top-level
+    field (entities, tables, ...) is complete, then ("result", parsed_json) once the response is complete. A cached result is yielded as ("result", ...) straight away, and so is the
+    merged result of a chunked extraction (its chunks run concurrently, so there is no single token stream).
+    """
+    mode = mode or EXTRACTION_PROMPT_MODE
+    pages = _ocr_pages(ocr_content)
+    ocr_text = "\n\n".join(pages)
+    if _needs_chunking(ocr_text):
+        yield "result", await run_llm_extraction_async(pages, use_cache, mode)
+        return
+    payload, cache_key, cached = _prepare_extraction(ocr_text, use_cache, mode)
+    if cached is not None:
+        yield "result", _parse_extraction(cached, ocr_text, mode)
+        return
+    start = time.perf_counter()
+    chunks = []
+    parser = IncrementalJSONParser()
+    async for chunk in ollama.chat_stream_async(payload):
+        text = chunk.get("message", {}).get("content", "") or chunk.get("response", "")
+        if text:
+            chunks.append(text)
+            yield "token", text
+            for field in parser.feed(text):
+                yield "field", field
+        if chunk.get("done"):
+            # The final chunk carries the token counters
+            extraction_stats.record(mode, chunk, time.perf_counter() - start)
+            break
+    content = response_content({"response": "".join(chunks)})
+    if cache_key is not None:
+        _store_if_valid(cache_key, content, mode)
+    yield "result", _parse_extraction(content, ocr_text, mode)
+
+def run_llm_extraction_to_file(ocr_content, parsed_output_file, use_cache=True):
+    """File-output wrapper around run_llm_extraction for main.py. Returns the parsed JSON, or None on error."""
     try:
-        response = requests.post(f"{OLLAMA_BASE_URL}/api/chat", json=payload)
-        response.raise_for_status()
-        result = response.json()
-        content = result["message"]["content"] if "message" in result else result.get("response", "")
-        content = content.strip()
-        if content.startswith('```json'):
-            content = content[7:]
-        if content.endswith('```'):
-            content = content[:-3]
-        content = content.strip()
-        with open(parsed_output_file, "w", encoding="utf-8") as f:
-            f.write(content)
+        parsed_json = run_llm_extraction(ocr_content, use_cache=use_cache)
     except Exception as e:
-        print(f"Error during inference: {e}") 
\ No newline at end of file
+        print(f"Error during inference: {e}")
+        return None
+    with open(parsed_output_file, "w", encoding="utf-8") as f:
+        json.dump(parsed_json, f, indent=2, ensure_ascii=False)
+    return parsed_json
@@ -0,0 +1,248 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOBS_DIR = os.environ.get("JOBS_DIR", os.path.join(os.path.expanduser("~"), ".cache", "olmocr_core", "jobs"))
+# How many documents are processed at once; model work inside a job still goes through the OCR executor
+JOBS_MAX_WORKERS = int(os.environ.get("JOBS_MAX_WORKERS", "1"))
+# A running job whose worker has not checked in for this long (crashed process) may be taken over by
+# another worker; live workers refresh their jobs' lease every JOBS_LEASE_SECONDS / 3
+JOBS_LEASE_SECONDS = float(os.environ.get("JOBS_LEASE_SECONDS", "300"))
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+class JobStore:
+    """SQLite-backed job records, so job status and results survive a server restart."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    filename TEXT,
+                    file_path TEXT,
+                    pages TEXT,
+                    extract INTEGER,
+                    batch_size INTEGER,
+                    total_pages INTEGER,
+                    results TEXT,
+                    parsed_json TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER DEFAULT 0,
+                    owner TEXT,
+                    created_at REAL,
+                    updated_at REAL
+                )
+                """
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "owner" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def create(self, job_id, filename, file_path, pages, extract, batch_size):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, filename, file_path, pages, extract, batch_size, results, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?, '[]', ?, ?)",
+                (job_id, filename, file_path, pages, int(extract), batch_size, now, now),
+            )
+
+    def _execute_update(self, fields, condition, params):
+        if "results" in fields:
+            fields["results"] = json.dumps(fields["results"])
+        if "parsed_json" in fields and fields["parsed_json"] is not None:
+            fields["parsed_json"] = json.dumps(fields["parsed_json"])
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(f"UPDATE jobs SET {assignments} WHERE {condition}", (*fields.values(), *params))
+            return cursor.rowcount == 1
+
+    def update(self, job_id, **fields):
+        """Update fields without touching the status; status changes go through transition()/claim()."""
+        self._execute_update(fields, "id = ?", (job_id,))
+
+    def transition(self, job_id, from_status, to_status, owner=None, **fields):
+        """Move a job from from_status to to_status in one conditional UPDATE.
+
+        Returns False, changing nothing, if the job was no longer in from_status (or, with owner, is held by
+        another worker), so concurrent workers and cancel requests cannot overwrite each other's status.
+        """
+        condition, params = "id = ? AND status = ?", [job_id, from_status]
+        if owner is not None:
+            condition += " AND owner = ?"
+            params.append(owner)
+        return self._execute_update({**fields, "status": to_status}, condition, params)
+
+    def claim(self, job_id, owner):
+        """Take a queued job, or a running one whose lease expired, for owner. Only one worker can win."""
+        return self._execute_update(
+            {"status": "running", "owner": owner},
+            "id = ? AND (status = 'queued' OR (status = 'running' AND updated_at < ?))",
+            (job_id, time.time() - JOBS_LEASE_SECONDS),
+        )
+
+    def update_owned(self, job_id, owner, **fields):
+        """Update fields of a job owner is still running; False if it was taken over, cancelled or finished."""
+        return self._execute_update(fields, "id = ? AND status = 'running' AND owner = ?", (job_id, owner))
+
+    def renew_lease(self, job_id, owner):
+        self.update_owned(job_id, owner)
+
+    def get(self, job_id):
+        with self._lock, self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["results"] = json.loads(job["results"] or "[]")
+        job["parsed_json"] = json.loads(job["parsed_json"]) if job["parsed_json"] else None
+        job["extract"] = bool(job["extract"])
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def claimable_ids(self):
+        """Queued jobs, and running jobs whose worker stopped renewing its lease."""
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND updated_at < ?) ORDER BY created_at",
+                (time.time() - JOBS_LEASE_SECONDS,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+
+class JobManager:
+    """Runs OCR (+ optional LLM extraction) jobs on a bounded worker pool and records progress per page.
+
+    Every uvicorn worker has its own JobManager on the shared SQLite store; a job runs in whichever one
+    claims it first.
+    """
+
+    def __init__(self, jobs_dir=JOBS_DIR, max_workers=JOBS_MAX_WORKERS, model_executor=None):
+        self.files_dir = os.path.join(jobs_dir, "files")
+        os.makedirs(self.files_dir, exist_ok=True)
+        self.store = JobStore(os.path.join(jobs_dir, "jobs.db"))
+        self.model_executor = model_executor
+        self.worker_id = uuid.uuid4().hex
+        self._workers = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ocr-job")
+
+    def submit(self, fileobj, filename, pages="all", extract=True, batch_size=1):
+        """Store the uploaded file, record a queued job and schedule it. Returns the job id."""
+        job_id = uuid.uuid4().hex
+        file_path = os.path.join(self.files_dir, job_id + os.path.splitext(filename)[1])
+        with open(file_path, "wb") as f:
+            shutil.copyfileobj(fileobj, f)
+        self.store.create(job_id, filename, file_path, pages, extract, batch_size)
+        self._workers.submit(self._run, job_id)
+        return job_id
+
+    def resume_unfinished(self):
+        """Schedule jobs left queued, or running by a process that died; finished pages are not redone.
+
+        Jobs another live worker is running keep their lease and are left alone.
+        """
+        for job_id in self.store.claimable_ids():
+            self._workers.submit(self._run, job_id)
+
+    def cancel(self, job_id):
+        """Request cancellation. Queued jobs stop immediately; running jobs stop after the current page."""
+        job = self.store.get(job_id)
+        if job is None or job["status"] in TERMINAL_STATUSES:
+            return job
+        if self.store.transition(job_id, "queued", "cancelled", cancel_requested=1):
+            if os.path.exists(job["file_path"]):
+                os.remove(job["file_path"])
+        else:
+            # It started in the meantime; the worker stops after the current page
+            self.store.update(job_id, cancel_requested=1)
+        return self.store.get(job_id)
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def shutdown(self):
+        self._workers.shutdown(wait=False, cancel_futures=True)
+
+    def _on_model_executor(self, func, *args):
+        if self.model_executor is None:
+            return func(*args)
+        return self.model_executor.submit(func, *args).result()
+
+    def _keep_lease(self, job_id, stop):
+        while not stop.wait(JOBS_LEASE_SECONDS / 3):
+            self.store.renew_lease(job_id, self.worker_id)
+
+    def _finish(self, job_id, status, **fields):
+        return self.store.transition(job_id, "running", status, owner=self.worker_id, **fields)
+
+    def _run(self, job_id):
+        # Imported here so the job subsystem does not load the OCR stack until a job actually runs
+        from ocr import get_pdf_page_count, is_pdf_file, parse_page_range, run_ocr_pages
+        from inference import run_llm_extraction
+
+        if not self.store.claim(job_id, self.worker_id):
+            return  # Cancelled, finished, or being run by another worker
+        job = self.store.get(job_id)
+        stop_lease = threading.Event()
+        threading.Thread(target=self._keep_lease, args=(job_id, stop_lease), daemon=True).start()
+        page_iter = None
+        try:
+            num_pages = get_pdf_page_count(job["file_path"]) if is_pdf_file(job["file_path"]) else 1
+            page_nums = parse_page_range(job["pages"], num_pages)
+            results = job["results"]
+            done_pages = {page["page_num"] for page in results}
+            remaining = [page_num for page_num in page_nums if page_num not in done_pages]
+            if not self.store.update_owned(job_id, self.worker_id, total_pages=len(page_nums)):
+                return  # Lost the job in the meantime
+
+            if remaining:
+                page_iter = run_ocr_pages(
+                    job["file_path"],
+                    pages=",".join(str(page_num) for page_num in remaining),
+                    batch_size=job["batch_size"] or 1,
+                )
+                while True:
+                    if self.store.get(job_id)["cancel_requested"]:
+                        self._finish(job_id, "cancelled")
+                        return
+                    page = self._on_model_executor(next, page_iter, None)
+                    if page is None:
+                        break
+                    results.append(page)
+                    if not self.store.update_owned(job_id, self.worker_id, results=results):
+                        return  # Another worker took the job over, or it was cancelled or finished
+
+            parsed_json = None
+            if job["extract"]:
+                if self.store.get(job_id)["cancel_requested"]:
+                    self._finish(job_id, "cancelled")
+                    return
+                results.sort(key=lambda page: page["page_num"])
+                # Passing pages (not joined text) lets long documents be chunked on page boundaries
+                parsed_json = run_llm_extraction([page["ocr_text"] for page in results])
+            self._finish(job_id, "completed", parsed_json=parsed_json)
+        except Exception as e:
+            self._finish(job_id, "failed", error=str(e))
+        finally:
+            stop_lease.set()
+            if page_iter is not None:
+                # Stops the render prefetch for pages a cancelled job will not use
+                page_iter.close()
+            job = self.store.get(job_id)
+            if job["status"] in TERMINAL_STATUSES and job["owner"] == self.worker_id and os.path.exists(job["file_path"]):
+                os.remove(job["file_path"])
@@ -0,0 +1,211 @@
+import json
+import re
+
+
+class JSONObjectScanner:
+    """Tracks, character by character, whether streamed text has closed its top-level JSON object.
+
+    Text before the first "{" (whitespace, a ```json fence) is ignored. Braces inside strings and
+    escaped quotes are handled, so the scanner reports completion exactly when the outermost object's
+    closing brace arrives.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.started = False
+        self.complete = False
+
+    def feed(self, text):
+        """Consume more text and return True once the top-level object is complete."""
+        for char in text:
+            if self.complete:
+                break
+            if not self.started:
+                if char == "{":
+                    self.started = True
+                    self.depth = 1
+                continue
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.complete = True
+        return self.complete
+
+
+class IncrementalJSONParser(JSONObjectScanner):
+    """A JSONObjectScanner that also parses the top-level object's fields as they complete.
+
+    feed() returns the (key, value) pairs completed by the new text, so callers can act on e.g.
+    "primary_language" or "entities" before generation ends.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.fields = {}
+        self._buffer = []
+        self._expect_key = False
+        self._key_start = None
+        self._key = None
+        self._value_start = None
+
+    def feed(self, text):
+        """Consume more text and return the list of (key, value) fields it completed."""
+        completed = []
+        for char in text:
+            if self.complete:
+                break
+            if not self.started:
+                if char == "{":
+                    self.started = True
+                    self.depth = 1
+                    self._expect_key = True
+                    self._buffer.append(char)
+                continue
+            position = len(self._buffer)
+            self._buffer.append(char)
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    if self._key_start is not None:
+                        self._key = json.loads(self._text(self._key_start, position + 1))
+                        self._key_start = None
+            elif char == '"':
+                self.in_string = True
+                if self.depth == 1 and self._expect_key:
+                    self._key_start = position
+            elif self.depth == 1 and char == ":":
+                self._expect_key = False
+                self._value_start = position + 1
+            elif self.depth == 1 and char == ",":
+                self._finish_value(position, completed)
+                self._expect_key = True
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self._finish_value(position, completed)
+                    self.complete = True
+        return completed
+
+    def _text(self, start=0, end=None):
+        return "".join(self._buffer[start:end])
+
+    def _finish_value(self, end, completed):
+        if self._value_start is None:
+            return
+        key, start = self._key, self._value_start
+        self._key = self._value_start = None
+        try:
+            value = json.loads(self._text(start, end))
+        except ValueError:
+            return
+        self.fields[key] = value
+        completed.append((key, value))
+
+
+_PARTIAL_UNICODE_ESCAPE = re.compile(r"\\u[0-9a-fA-F]{0,3}$")
+
+
+def _trim_partial_escape(text):
+    """Drop a trailing escape sequence cut off mid-way (a lone backslash or a short \\uXXXX)."""
+    text = _PARTIAL_UNICODE_ESCAPE.sub("", text)
+    trailing = len(text) - len(text.rstrip("\\"))
+    return text[:-1] if trailing % 2 else text
+
+
+def _closers(stack):
+    return "".join("}" if opener == "{" else "]" for opener, _ in reversed(stack))
+
+
+def repair_truncated_json(text):
+    """Turn a JSON object or array cut off mid-generation into valid JSON holding everything complete so far.
+
+    The document is cut after the last complete value (a dangling key, colon or comma is dropped) and the
+    open objects and arrays are closed; a string value cut off mid-way is kept up to where it stopped.
+    Returns the repaired text, or None if no object or array starts in text.
+    """
+    starts = [index for index in (text.find("{"), text.find("[")) if index != -1]
+    if not starts:
+        return None
+    start = min(starts)
+    # One [opener, expecting_key] entry per open container
+    stack = []
+    # (end, closers): the latest point the document can be cut and closed validly
+    checkpoint = None
+    in_string = escape = string_is_key = False
+    index = start
+    while index < len(text):
+        char = text[index]
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+                if not string_is_key:
+                    checkpoint = (index + 1, _closers(stack))
+        elif char == '"':
+            in_string = True
+            string_is_key = stack[-1][0] == "{" and stack[-1][1]
+        elif char in "{[":
+            stack.append([char, char == "{"])
+            checkpoint = (index + 1, _closers(stack))
+        elif char in "}]":
+            stack.pop()
+            if not stack:
+                return text[start:index + 1]
+            checkpoint = (index + 1, _closers(stack))
+        elif char in ":,":
+            if stack[-1][0] == "{":
+                stack[-1][1] = char == ","
+        elif not char.isspace():
+            # A number or literal is only known to be complete once a delimiter follows it
+            end = index
+            while end < len(text) and text[end] not in ",}] \t\r\n":
+                end += 1
+            if end == len(text):
+                break
+            checkpoint = (end, _closers(stack))
+            index = end
+            continue
+        index += 1
+    if in_string and not string_is_key:
+        return _trim_partial_escape(text[start:]) + '"' + _closers(stack)
+    if checkpoint is None:
+        return None
+    end, closers = checkpoint
+    return text[start:end] + closers
+
+
+def parse_partial_json(text):
+    """json.loads(text), falling back to the salvageable part of truncated output; None if nothing parses."""
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    repaired = repair_truncated_json(text)
+    if repaired is None:
+        return None
+    try:
+        return json.loads(repaired)
+    except ValueError:
+        return None
@@ -0,0 +1,40 @@
+import hashlib
+import json
+import os
+import re
+
+from cache import LRUCache, TieredCache
+
+# Structured-extraction results are memoized on the OCR text, so templated forms and frontend
+# retries skip the Ollama round trip. Entries expire after LLM_CACHE_TTL_SECONDS.
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "1024"))
+LLM_CACHE_TTL_SECONDS = float(os.environ.get("LLM_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+
+_HORIZONTAL_WHITESPACE = re.compile(r"[ \t\f\v]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def normalize_ocr_text(ocr_text):
+    """Collapse whitespace differences that do not change what the LLM extracts."""
+    text = ocr_text.replace("\r\n", "\n").replace("\r", "\n")
+    text = "\n".join(_HORIZONTAL_WHITESPACE.sub(" ", line).strip() for line in text.split("\n"))
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+def llm_cache_key(task, prompt_version, model, options, ocr_text):
+    """Build the cache key for one extraction call from the task, its prompt version, the model settings and the text."""
+    key_material = json.dumps(
+        {
+            "task": task,
+            "prompt_version": prompt_version,
+            "model": model,
+            "options": options,
+            "text": normalize_ocr_text(ocr_text),
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+
+llm_result_cache = TieredCache(LRUCache(max_entries=LLM_CACHE_MAX_ENTRIES, ttl_seconds=LLM_CACHE_TTL_SECONDS))
@@ -1,6 +1,6 @@
 import argparse
 from ocr import run_ocr
-from inference import run_llm_extraction
+from inference import run_llm_extraction_to_file
 
 # User can set this variable to the desired file path
 # DEFAULT_TEST_FILE = "src/olmocr_core/test_ocr_files/book_order_letter.pdf"
@@ -15,12 +15,12 @@ def main():
     args = parser.parse_args()
 
     print(f"\nRunning OCR on {args.input_file}...")
-    run_ocr(args.input_file, page_num=args.page_num, output_file=args.ocr_output)
+    ocr_text = run_ocr(args.input_file, page_num=args.page_num, output_file=args.ocr_output)
     print(f"\nOCR output saved to {args.ocr_output}")
 
     print("\nRunning LLM extraction...")
-    run_llm_extraction(args.ocr_output, args.parsed_output)
-    print(f"\nParsed output saved to {args.parsed_output}")
+    if run_llm_extraction_to_file(ocr_text, args.parsed_output) is not None:
+        print(f"\nParsed output saved to {args.parsed_output}")
 
 if __name__ == "__main__":
     main() 
@@ -0,0 +1,147 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily
+
+# Prometheus metrics for the API process, served at /metrics. Everything registers in
+# prometheus_client's default registry, so the values are per process (one uvicorn worker).
+
+# upload, preprocess (render / resize), anchor_text, prefill, decode, ollama, json_parse
+STAGE_SECONDS = Histogram(
+    "ocr_stage_seconds",
+    "Time spent in each pipeline stage",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+# component is "ocr" (olmOCR model or server) or "llm" (Ollama)
+PROMPT_TOKENS = Counter("ocr_prompt_tokens_total", "Prompt tokens processed", ["component"])
+GENERATED_TOKENS = Counter("ocr_generated_tokens_total", "Tokens generated", ["component"])
+TOKENS_PER_SECOND = Histogram(
+    "ocr_decode_tokens_per_second",
+    "Decode throughput per generate call",
+    ["component"],
+    buckets=(1, 2.5, 5, 10, 20, 40, 80, 160, 320, 640, 1280),
+)
+ERRORS = Counter("ocr_errors_total", "Errors inside the pipeline, by where they happened", ["component"])
+
+REQUESTS_IN_PROGRESS = Gauge("ocr_api_requests_in_progress", "Requests being handled, including open streams", ["endpoint"])
+REQUESTS = Counter("ocr_api_requests_total", "Finished requests", ["endpoint", "status"])
+REQUEST_SECONDS = Histogram(
+    "ocr_api_request_seconds",
+    "Request duration, until the last byte of a streamed response",
+    ["endpoint"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+
+_local = threading.local()
+
+
+def observe_stage(stage, seconds):
+    captured = getattr(_local, "captured", None)
+    if captured is not None:
+        captured.append((stage, seconds))
+    else:
+        STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+@contextmanager
+def time_stage(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def capture_stage_timings():
+    """Collect this thread's stage timings in a list instead of the histograms.
+
+    Render workers are separate processes, so they ship the list back to the parent, which passes it
+    to merge_stage_timings.
+    """
+    _local.captured = captured = []
+    try:
+        yield captured
+    finally:
+        _local.captured = None
+
+
+def merge_stage_timings(timings):
+    for stage, seconds in timings:
+        STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def record_tokens(component, prompt_tokens, generated_tokens, decode_seconds=None):
+    PROMPT_TOKENS.labels(component).inc(prompt_tokens or 0)
+    GENERATED_TOKENS.labels(component).inc(generated_tokens or 0)
+    if generated_tokens and decode_seconds:
+        TOKENS_PER_SECOND.labels(component).observe(generated_tokens / decode_seconds)
+
+
+def record_error(component):
+    ERRORS.labels(component).inc()
+
+
+class CacheStatsCollector:
+    """Exposes the caches' own hit/miss counters as ocr_cache_lookups_total{cache, result} at scrape time.
+
+    `caches` maps a cache name to (stats function, {stats key: result label}).
+    """
+
+    def __init__(self, caches):
+        self.caches = caches
+
+    def collect(self):
+        family = CounterMetricFamily("ocr_cache_lookups", "Cache lookups by outcome", labels=["cache", "result"])
+        for name, (stats, results) in self.caches.items():
+            values = stats()
+            for key, result in results.items():
+                family.add_metric([name, result], values.get(key, 0))
+        yield family
+
+
+def _endpoint(scope):
+    """The route's path template ("/jobs/{job_id}"), so label values stay bounded."""
+    # Imported here so that ocr.py (CLI, render workers) can use the stage metrics without starlette
+    from starlette.routing import Match
+
+    for route in scope["app"].router.routes:
+        if route.matches(scope)[0] == Match.FULL:
+            return route.path
+    return "other"
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording in-flight requests, request counts by status and duration per endpoint.
+
+    It wraps the whole response rather than the handler, so a streaming endpoint stays in flight until
+    its last event is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        endpoint = _endpoint(scope)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        REQUESTS_IN_PROGRESS.labels(endpoint).inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_PROGRESS.labels(endpoint).dec()
+            REQUESTS.labels(endpoint, str(status)).inc()
+            REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - start)
@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+
+# torch and transformers are imported inside OCRModelManager.load() so that importing this
+# module (and api.py) stays cheap for workers that only serve the text endpoints.
+
+OCR_MODEL_ID = os.environ.get("OCR_MODEL_ID", "allenai/olmOCR-7B-0225-preview")
+OCR_PROCESSOR_ID = os.environ.get("OCR_PROCESSOR_ID", "Qwen/Qwen2-VL-7B-Instruct")
+
+# "default": bfloat16 on CUDA when available, otherwise CPU. "cpu": CPU-only deployments, float32 weights
+# with the Linear layers dynamically quantized to int8 (OCR_CPU_QUANTIZE=0 keeps them float32).
+OCR_PROFILE = os.environ.get("OCR_PROFILE", "default")
+OCR_CPU_QUANTIZE = os.environ.get("OCR_CPU_QUANTIZE", "1") == "1"
+# Intra-op threads for CPU inference (0 keeps torch's default, one per physical core)
+OCR_CPU_THREADS = int(os.environ.get("OCR_CPU_THREADS", "0"))
+# Compile the model's forward with torch.compile (slow first call; pays off for long-running workers)
+OCR_TORCH_COMPILE = os.environ.get("OCR_TORCH_COMPILE", "0") == "1"
+
+PROFILES = ("default", "cpu")
+
+
+class OCRModelManager:
+    """Loads the OCR model and processor on first use and keeps one shared copy per process."""
+
+    def __init__(self, model_id=OCR_MODEL_ID, processor_id=OCR_PROCESSOR_ID, profile=OCR_PROFILE):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown OCR_PROFILE {profile!r}; expected one of {', '.join(PROFILES)}")
+        self.model_id = model_id
+        self.processor_id = processor_id
+        self.profile = profile
+        self.model = None
+        self.processor = None
+        self.device = None
+        self.state = "not_loaded"  # not_loaded -> loading -> ready | failed
+        self.error = None
+        self.load_seconds = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_ready(self):
+        return self.state == "ready"
+
+    def load(self):
+        """Load the model and processor if they are not loaded yet. Safe to call from several threads."""
+        with self._lock:
+            if self.is_ready:
+                return
+            self.state = "loading"
+            self.error = None
+            start = time.perf_counter()
+            try:
+                import torch
+                from transformers import AutoProcessor, Qwen2VLForConditionalGeneration
+
+                if OCR_CPU_THREADS > 0:
+                    torch.set_num_threads(OCR_CPU_THREADS)
+                if self.profile == "cpu":
+                    # Dynamic int8 kernels run on float32 activations; bfloat16 matmuls are slow on most CPUs.
+                    # low_cpu_mem_usage loads the checkpoint straight into the model (no random-init copy)
+                    # and inplace quantization swaps the Linear layers without deep-copying the model,
+                    # so peak memory stays at one float32 copy.
+                    model = Qwen2VLForConditionalGeneration.from_pretrained(
+                        self.model_id, torch_dtype=torch.float32, low_cpu_mem_usage=True
+                    ).eval()
+                    if OCR_CPU_QUANTIZE:
+                        torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+                    device = torch.device("cpu")
+                else:
+                    model = Qwen2VLForConditionalGeneration.from_pretrained(
+                        self.model_id, torch_dtype=torch.bfloat16, low_cpu_mem_usage=True
+                    ).eval()
+                    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+                    model.to(device)
+                if OCR_TORCH_COMPILE:
+                    model.forward = torch.compile(model.forward, dynamic=True)
+                processor = AutoProcessor.from_pretrained(self.processor_id)
+                # Batched generation needs every prompt to end at the same position, so pad on the left
+                processor.tokenizer.padding_side = "left"
+            except Exception as e:
+                self.state = "failed"
+                self.error = str(e)
+                raise
+            self.model = model
+            self.processor = processor
+            self.device = device
+            self.load_seconds = time.perf_counter() - start
+            self.state = "ready"
+
+    def use(self, model, processor, device, model_id=None):
+        """Install an already-loaded model and processor instead of loading model_id (benchmarks, custom builds)."""
+        with self._lock:
+            self.model = model
+            self.processor = processor
+            self.device = device
+            # The id is part of OCR cache keys, so a different model must not reuse the default one
+            self.model_id = model_id or self.model_id
+            self.load_seconds = 0.0
+            self.error = None
+            self.state = "ready"
+
+    def get(self):
+        """Return (model, processor, device), loading them on first use."""
+        if not self.is_ready:
+            self.load()
+        return self.model, self.processor, self.device
+
+    def status(self):
+        """Readiness information for health checks."""
+        return {
+            "state": self.state,
+            "model_id": self.model_id,
+            "profile": self.profile,
+            "device": str(self.device) if self.device is not None else None,
+            "load_seconds": self.load_seconds,
+            "error": self.error,
+        }
+
+
+# Process-wide singleton used by ocr.py and the API
+ocr_model = OCRModelManager()
@@ -1,27 +1,56 @@
-import torch
 import base64
+import multiprocessing
+import subprocess
+import threading
 import urllib.request
 import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 from io import BytesIO
 from PIL import Image
-from transformers import AutoProcessor, Qwen2VLForConditionalGeneration
 
-from olmocr.data.renderpdf import render_pdf_to_base64png
+from olmocr.data.renderpdf import get_pdf_media_box_width_height
 from olmocr.prompts import build_finetuning_prompt
-from olmocr.prompts.anchor import get_anchor_text
 from olmocr.image_utils import convert_image_to_pdf_bytes
+from pypdf import PdfReader
 
 import sys
 import json
-import requests
 
-# Initialize the model
-model = Qwen2VLForConditionalGeneration.from_pretrained("allenai/olmOCR-7B-0225-preview", torch_dtype=torch.bfloat16).eval()
-processor = AutoProcessor.from_pretrained("Qwen/Qwen2-VL-7B-Instruct")
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model.to(device)
+from model_manager import ocr_model
+from ocr_backends import ocr_backend
+from anchor_cache import anchor_text_cache
+from json_stream import JSONObjectScanner
+from prefix_cache import OCR_PREFIX_CACHE, get_prefix_cache
+from ocr_cache import OCR_CACHE_ENABLED, hash_file, ocr_cache_key, ocr_result_cache
+from llm_cache import LLM_CACHE_ENABLED, llm_cache_key, llm_result_cache
+from extraction_schemas import Entities, Table, entities_format, response_format, validate_partial_json
+from entity_rules import ENTITY_RULES_ENABLED, extract_entities, merge_entities, types_needing_llm
+from ollama_client import ollama, response_content
+from metrics import capture_stage_timings, merge_stage_timings, observe_stage, record_error, record_tokens, time_stage
+
+# Upper bound on how many pages are packed into a single model.generate call
+OCR_MAX_BATCH_SIZE = int(os.environ.get("OCR_MAX_BATCH_SIZE", "4"))
+
+# Worker processes that render and anchor upcoming pages while the model decodes the current ones
+# (0 renders inline on the calling thread), and how many pages they may run ahead of the model
+OCR_RENDER_WORKERS = int(os.environ.get("OCR_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+OCR_PREFETCH_PAGES = int(os.environ.get("OCR_PREFETCH_PAGES", "4"))
+
+# Token ceiling per page. Generation normally ends well before it, as soon as the model's JSON
+# response is closed, so this only bounds pathological pages instead of truncating long ones.
+OCR_MAX_NEW_TOKENS = int(os.environ.get("OCR_MAX_NEW_TOKENS", "3000"))
+
+# Sampling settings for model.generate; also part of the OCR cache key
+OCR_GENERATION_KWARGS = {
+    "temperature": 0.8,
+    "max_new_tokens": OCR_MAX_NEW_TOKENS,
+    "num_return_sequences": 1,
+    "do_sample": True,
+}
 
 
 def is_pdf_file(file_path):
@@ -67,7 +96,7 @@ def is_image_file(file_path):
 
 
 def process_image_file(image_path, target_longest_image_dim=1024):
-    """Process an image file and return base64 encoded image and anchor text."""
+    """Process an image file and return the resized PIL image and anchor text."""
     # Open and resize the image
     with Image.open(image_path) as img:
         # Convert to RGB if necessary
@@ -83,54 +112,166 @@ def process_image_file(image_path, target_longest_image_dim=1024):
             new_height = target_longest_image_dim
             new_width = int(width * target_longest_image_dim / height)
         
+        # resize() returns a new image, so it stays usable after the file is closed
         img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        # Convert to base64
-        buffered = BytesIO()
-        img.save(buffered, format="PNG")
-        image_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
     
     # For images, we create a simple anchor text with basic metadata
     # since we don't have PDF metadata
     anchor_text = f"Page dimensions: {width}.0x{height}.0\n[Image 0x0 to {new_width}x{new_height}]"
     
-    return image_base64, anchor_text
+    return img, anchor_text
+
+
+def render_pdf_to_image(pdf_path, page_num=1, target_longest_image_dim=1024):
+    """Render one PDF page to a PIL image whose longest side is target_longest_image_dim.
+
+    Same rendering as olmocr's render_pdf_to_base64png, but pdftoppm writes uncompressed PPM to stdout,
+    so there is no PNG compress/decompress or base64 step before the image reaches the processor.
+    """
+    longest_dim = max(get_pdf_media_box_width_height(pdf_path, page_num))
+    pdftoppm_result = subprocess.run(
+        [
+            "pdftoppm",
+            "-f", str(page_num),
+            "-l", str(page_num),
+            "-r", str(target_longest_image_dim * 72 / longest_dim),
+            pdf_path,
+        ],
+        timeout=120,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if pdftoppm_result.returncode != 0:
+        raise RuntimeError(f"pdftoppm failed on page {page_num}: {pdftoppm_result.stderr.decode(errors='replace')}")
+    image = Image.open(BytesIO(pdftoppm_result.stdout))
+    image.load()
+    return image
+
+
+def image_to_base64png(image):
+    """PNG-encode a PIL image as base64, for backends that need the image as a data URL."""
+    buffered = BytesIO()
+    image.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode("utf-8")
 
 
 def process_pdf_file(pdf_path, page_num=1, target_longest_image_dim=1024, target_anchor_text_len=4000):
-    """Process a PDF file and return base64 encoded image and anchor text."""
+    """Process a PDF file and return the rendered page as a PIL image and its anchor text."""
     # Render page to an image
-    image_base64 = render_pdf_to_base64png(pdf_path, page_num, target_longest_image_dim=target_longest_image_dim)
+    with time_stage("preprocess"):
+        image = render_pdf_to_image(pdf_path, page_num, target_longest_image_dim=target_longest_image_dim)
     
     # Build the prompt, using document metadata 
-    anchor_text = get_anchor_text(pdf_path, page_num, pdf_engine="pdfreport", target_length=target_anchor_text_len)
+    # The parsed PDF is reused across pages of the same document
+    with time_stage("anchor_text"):
+        anchor_text = anchor_text_cache.get_anchor_text(pdf_path, page_num, target_length=target_anchor_text_len)
     
-    return image_base64, anchor_text
+    return image, anchor_text
+
+
+def get_pdf_page_count(pdf_path):
+    """Return the number of pages in a PDF file."""
+    reader = PdfReader(pdf_path)
+    return reader.get_num_pages()
+
+
+def parse_page_range(pages, num_pages):
+    """Turn a page selection like "all", "3" or "1-4,7" into a sorted list of 1-based page numbers."""
+    if pages is None or str(pages).strip().lower() in ("", "all"):
+        return list(range(1, num_pages + 1))
+
+    page_nums = set()
+    for part in str(pages).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            start = int(start) if start.strip() else 1
+            end = int(end) if end.strip() else num_pages
+        else:
+            start = end = int(part)
+        if start < 1 or end > num_pages or start > end:
+            raise ValueError(f"Invalid page range '{part}' for a document with {num_pages} page(s)")
+        page_nums.update(range(start, end + 1))
+
+    if not page_nums:
+        raise ValueError(f"No pages selected by '{pages}'")
+    return sorted(page_nums)
 
 
 def process_file(file_path, page_num=1, target_longest_image_dim=1024, target_anchor_text_len=4000):
-    """Process a file (PDF or image) and return base64 encoded image and anchor text."""
+    """Process a file (PDF or image) and return the page as a PIL image and its anchor text."""
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File not found: {file_path}")
     
     if is_pdf_file(file_path):
         return process_pdf_file(file_path, page_num, target_longest_image_dim, target_anchor_text_len)
     elif is_image_file(file_path):
-        return process_image_file(file_path, target_longest_image_dim)
+        with time_stage("preprocess"):
+            return process_image_file(file_path, target_longest_image_dim)
     else:
         raise ValueError(f"Unsupported file type: {file_path}")
 
 
-def call_ollama_entities_extraction(ocr_text: str) -> dict:
-    OLLAMA_BASE_URL = "http://localhost:11434"
-    OLLAMA_MODEL = "qwen2.5vl:7b"
+# Bump whenever the matching prompt below changes so stale cached extractions are not reused
+ENTITIES_PROMPT_VERSION = "3"
+TABLE_PROMPT_VERSION = "2"
+
+
+def _request_ollama_content(payload, cache_key=None):
+    """Send a chat payload through the shared Ollama client and return the message content without ```json fences.
+
+    With a cache_key, a cached response is returned without calling Ollama, and fresh responses are
+    stored once they parse as JSON so a malformed answer is not replayed on retry.
+    """
+    if cache_key is not None:
+        cached = llm_result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    content = response_content(ollama.chat(payload))
+    if cache_key is not None and _is_json(content):
+        llm_result_cache.put(cache_key, content)
+    return content
+
+
+def _is_json(content):
+    try:
+        json.loads(content)
+        return True
+    except ValueError:
+        return False
+
+
+ENTITY_TYPES = ("names", "dates", "addresses", "emails")
+ENTITY_FORMAT_LINES = {
+    "names": '"names": ["list of person names found"]',
+    "dates": '"dates": ["list of dates found in any format"]',
+    "addresses": '"addresses": ["list of complete addresses found (including street, city, state, postal code if present)"]',
+    "emails": '"emails": ["list of email addresses found"]',
+}
+
+
+def call_ollama_entities_extraction(ocr_text: str, use_cache: bool = True, entity_types=ENTITY_TYPES) -> dict:
+    """Extract entity_types (by default names, dates, addresses and emails).
+
+    The rule engine runs first. Ollama is asked only for the requested types the rules cannot settle
+    alone (all but emails), and the rule matches are merged into its answer; a request for emails only
+    is answered by the rules without calling Ollama.
+    """
+    wanted = [entity_type for entity_type in ENTITY_TYPES if entity_type in entity_types]
+    rule_entities = {}
+    entity_types = wanted
+    if ENTITY_RULES_ENABLED:
+        rule_entities = {key: values for key, values in extract_entities(ocr_text).items() if key in wanted}
+        entity_types = types_needing_llm(wanted)
+        if not entity_types:
+            return rule_entities
+    entity_format = ",\n    ".join(ENTITY_FORMAT_LINES[entity_type] for entity_type in entity_types)
     prompt = f"""
 You are an expert document parser. Extract the following entities from the provided text and return ONLY valid JSON in this format:
 {{
-    "names": ["list of person names found"],
-    "dates": ["list of dates found in any format"],
-    "addresses": ["list of complete addresses found (including street, city, state, postal code if present)"],
-    "emails": ["list of email addresses found"]
+    {entity_format}
 }}
 
 Rules:
@@ -180,34 +321,31 @@ Output:
         {"role": "user", "content": prompt}
     ]
     payload = {
-        "model": OLLAMA_MODEL,
+        "model": ollama.model,
         "messages": messages,
         "stream": False,
+        "format": entities_format(entity_types),
         "options": {
             "temperature": 0.1,
             "num_predict": 700
         }
     }
+    cache_key = None
+    if use_cache and LLM_CACHE_ENABLED:
+        task = "entities:" + ",".join(entity_types)
+        cache_key = llm_cache_key(task, ENTITIES_PROMPT_VERSION, payload["model"], payload["options"], ocr_text)
     try:
-        response = requests.post(f"{OLLAMA_BASE_URL}/api/chat", json=payload)
-        response.raise_for_status()
-        result = response.json()
-        content = result["message"]["content"] if "message" in result else result.get("response", "")
-        content = content.strip()
-        if content.startswith('```json'):
-            content = content[7:]
-        if content.endswith('```'):
-            content = content[:-3]
-        content = content.strip()
-        return json.loads(content)
+        content = _request_ollama_content(payload, cache_key)
+        llm_entities = validate_partial_json(Entities, content)
     except Exception as e:
         print(f"Error calling Ollama API for entities: {e}")
-        return {"names": [], "dates": [], "addresses": [], "emails": []}
+        llm_entities = {}
+    # Keep only the types Ollama was asked for; the rules settle the rest and add to these
+    llm_entities = {key: (llm_entities.get(key) or []) if key in entity_types else [] for key in wanted}
+    return merge_entities(rule_entities, llm_entities)
 
 
-def call_ollama_table_extraction(ocr_text: str) -> list:
-    OLLAMA_BASE_URL = "http://localhost:11434"
-    OLLAMA_MODEL = "qwen2.5vl:7b"
+def call_ollama_table_extraction(ocr_text: str, use_cache: bool = True) -> list:
     prompt = f"""
 Please analyze the following text and extract the main table in JSON format. Return ONLY valid JSON, no other text.
 
@@ -225,89 +363,373 @@ Extract the first table and return it in this exact JSON format:
 
 Rules:
 - Only extract the first table found in the text.
-- If no table is found, return an empty list []
+- If no table is found, return empty "headers" and "rows" lists
 - Return ONLY the JSON, no explanations or additional text
 """
     messages = [
         {"role": "user", "content": prompt}
     ]
     payload = {
-        "model": OLLAMA_MODEL,
+        "model": ollama.model,
         "messages": messages,
         "stream": False,
+        "format": response_format(Table),
         "options": {
             "temperature": 0.1,
             "num_predict": 1000
         }
     }
+    cache_key = None
+    if use_cache and LLM_CACHE_ENABLED:
+        cache_key = llm_cache_key("tables", TABLE_PROMPT_VERSION, payload["model"], payload["options"], ocr_text)
     try:
-        response = requests.post(f"{OLLAMA_BASE_URL}/api/chat", json=payload)
-        response.raise_for_status()
-        result = response.json()
-        content = result["message"]["content"] if "message" in result else result.get("response", "")
-        content = content.strip()
-        if content.startswith('```json'):
-            content = content[7:]
-        if content.endswith('```'):
-            content = content[:-3]
-        content = content.strip()
-        if not content:
-            return []
-        # Try to parse as a dict (single table) or list (multiple tables)
-        try:
-            parsed = json.loads(content)
-            if isinstance(parsed, dict):
-                return [parsed]
-            elif isinstance(parsed, list):
-                return parsed
-            else:
-                return []
-        except Exception:
-            return []
+        content = _request_ollama_content(payload, cache_key)
+        table = validate_partial_json(Table, content)
+        return [table] if table["headers"] or table["rows"] else []
     except Exception as e:
         print(f"Error calling Ollama API for tables: {e}")
         return []
 
 
-def run_ocr(file_path, page_num=1, target_longest_image_dim=1024, target_anchor_text_len=4000, output_file=None):
-    """Run OCR on a file (PDF or image) and save the result to output_file (required)."""
-    if output_file is None:
-        raise ValueError("output_file must be specified for run_ocr.")
-    image_base64, anchor_text = process_file(file_path, page_num, target_longest_image_dim, target_anchor_text_len)
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def _get_render_pool():
+    global _render_pool
+    if OCR_RENDER_WORKERS <= 0:
+        return None
+    with _render_pool_lock:
+        if _render_pool is None:
+            # spawn rather than fork: the parent may hold CUDA state and several threads
+            _render_pool = ProcessPoolExecutor(
+                max_workers=OCR_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _render_pool
+
+
+def _prepare_page_in_worker(file_path, page_num, target_longest_image_dim, target_anchor_text_len):
+    """Render-pool task: process_file plus the anchor-text counters and stage timings the worker accumulated, for the parent's stats."""
+    with capture_stage_timings() as timings:
+        prepared = process_file(file_path, page_num, target_longest_image_dim, target_anchor_text_len)
+    return prepared, anchor_text_cache.drain_stats(), timings
+
+
+def prefetch_pages(file_path, page_nums, target_longest_image_dim=1024, target_anchor_text_len=4000, prefetch=None):
+    """Yield (page_num, (image, anchor_text)) in order, preparing up to `prefetch` pages ahead on the render pool.
+
+    Pages keep rendering in the worker processes while the caller is busy with the model, so
+    rasterization and anchor extraction are hidden behind generation for multi-page documents.
+    """
+    pool = _get_render_pool()
+    if pool is None or len(page_nums) <= 1:
+        for page_num in page_nums:
+            yield page_num, process_file(file_path, page_num, target_longest_image_dim, target_anchor_text_len)
+        return
+
+    prefetch = max(1, prefetch or OCR_PREFETCH_PAGES)
+    upcoming = iter(page_nums)
+    pending = deque()
+
+    def submit_next():
+        page_num = next(upcoming, None)
+        if page_num is not None:
+            future = pool.submit(_prepare_page_in_worker, file_path, page_num, target_longest_image_dim, target_anchor_text_len)
+            pending.append((page_num, future))
+
+    try:
+        for _ in range(prefetch):
+            submit_next()
+        while pending:
+            page_num, future = pending.popleft()
+            submit_next()
+            prepared, anchor_stats, timings = future.result()
+            anchor_text_cache.merge_stats(anchor_stats)
+            merge_stage_timings(timings)
+            yield page_num, prepared
+    finally:
+        # The consumer stopped early (cancelled job, closed stream): drop renders nobody will use
+        for _, future in pending:
+            future.cancel()
+
+
+def build_ocr_messages(anchor_text, image_base64=None):
+    """Build the olmOCR chat messages for one page.
+
+    The in-process model only needs an image placeholder in the template; pass image_base64 to embed the
+    page as a data URL for backends that receive the messages over the wire.
+    """
     prompt = build_finetuning_prompt(anchor_text)
-    messages = [
+    if image_base64 is None:
+        image_content = {"type": "image"}
+    else:
+        image_content = {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image_base64}"}}
+    return [
         {
             "role": "user",
             "content": [
                 {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image_base64}"}},
+                image_content,
             ],
         }
     ]
-    text = processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-    main_image = Image.open(BytesIO(base64.b64decode(image_base64)))
+
+
+def _prepare_ocr_inputs(batch, processor, device):
+    """Tokenize a list of (image, anchor_text) pairs into one left-padded model input on the device."""
+    texts = []
+    images = []
+    for image, anchor_text in batch:
+        messages = build_ocr_messages(anchor_text)
+        texts.append(processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True))
+        # The decoded PIL image goes straight to the processor
+        images.append(image)
     inputs = processor(
-        text=[text],
-        images=[main_image],
+        text=texts,
+        images=images,
         padding=True,
         return_tensors="pt",
     )
-    inputs = {key: value.to(device) for (key, value) in inputs.items()}
-    output = model.generate(
-        **inputs,
-        temperature=0.8,
-        max_new_tokens=300,
-        num_return_sequences=1,
-        do_sample=True,
-    )
-    prompt_length = inputs["input_ids"].shape[1]
-    new_tokens = output[:, prompt_length:]
-    text_output = processor.tokenizer.batch_decode(
+    return {key: value.to(device) for (key, value) in inputs.items()}
+
+
+def _ocr_prompt_prefix(processor):
+    """The templated prompt text shared by every page: everything before the anchor text."""
+    sentinel = "<<ANCHOR_TEXT>>"
+    text = processor.apply_chat_template(build_ocr_messages(sentinel), tokenize=False, add_generation_prompt=True)
+    return text[:text.index(sentinel)]
+
+
+_prefix_cache_failed = False
+
+
+def _generate_with_prefix_cache(model, processor, device, inputs, **generate_kwargs):
+    """Generate reusing the cached prompt prefix; returns None when it cannot be used for these inputs."""
+    global _prefix_cache_failed
+    if not OCR_PREFIX_CACHE or _prefix_cache_failed:
+        return None
+    try:
+        prefix_cache = get_prefix_cache(model, processor, device, _ocr_prompt_prefix(processor))
+        return prefix_cache.generate(inputs, **generate_kwargs)
+    except Exception as e:
+        # Depends on Qwen2-VL internals (rope_deltas, get_rope_index); fall back to a full prefill for good
+        print(f"Prompt prefix cache disabled: {e}")
+        record_error("prefix_cache")
+        _prefix_cache_failed = True
+        return None
+
+
+def _make_text_streamer(tokenizer, on_text):
+    """Build a transformers streamer that calls on_text(chunk) with each newly decoded piece of text."""
+    # Imported here so that importing ocr.py does not pull in transformers
+    from transformers import TextStreamer
+
+    class CallbackStreamer(TextStreamer):
+        def on_finalized_text(self, text, stream_end=False):
+            if text:
+                on_text(text)
+
+    return CallbackStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+
+
+def _make_json_stopping_criteria(tokenizer, batch_size):
+    """Stop each row of a generation as soon as its olmOCR JSON object ({"primary_language": ..., "natural_text": ...}) is closed."""
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class JSONCompleteCriteria(StoppingCriteria):
+        def __init__(self):
+            self.scanners = [JSONObjectScanner() for _ in range(batch_size)]
+
+        def __call__(self, input_ids, scores, **kwargs):
+            # Called once per decode step, so only the newest token of each row needs scanning
+            for scanner, token_id in zip(self.scanners, input_ids[:, -1].tolist()):
+                if not scanner.complete:
+                    scanner.feed(tokenizer.decode([token_id], skip_special_tokens=True))
+            return torch.tensor([scanner.complete for scanner in self.scanners], dtype=torch.bool, device=input_ids.device)
+
+    return StoppingCriteriaList([JSONCompleteCriteria()])
+
+
+def _make_first_token_timer():
+    """A stopping criterion that never stops, but notes when the first token is out (the end of prefill)."""
+    import torch
+    from transformers import StoppingCriteria
+
+    class FirstTokenTimer(StoppingCriteria):
+        def __init__(self):
+            self.first_token_at = None
+
+        def __call__(self, input_ids, scores, **kwargs):
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+            return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+    return FirstTokenTimer()
+
+
+def _generate_ocr_batch(batch, on_text=None):
+    """Run the in-process OCR model once over a list of (image, anchor_text) pairs and return one decoded output per pair.
+
+    With on_text (single-item batches only), decoded text is passed to on_text as it is generated.
+    """
+    import torch
+
+    # The model is loaded lazily on the first OCR call (or by an explicit warm-up)
+    model, processor, device = ocr_model.get()
+    inputs = _prepare_ocr_inputs(batch, processor, device)
+    streamer = None
+    if on_text is not None:
+        if len(batch) != 1:
+            raise ValueError("Token streaming is only supported for a single page at a time.")
+        streamer = _make_text_streamer(processor.tokenizer, on_text)
+    first_token_timer = _make_first_token_timer()
+    stopping_criteria = _make_json_stopping_criteria(processor.tokenizer, len(batch))
+    stopping_criteria.append(first_token_timer)
+    generate_kwargs = dict(OCR_GENERATION_KWARGS, streamer=streamer, stopping_criteria=stopping_criteria)
+    start = time.perf_counter()
+    # inference_mode skips autograd bookkeeping entirely (cheaper than generate's own no_grad, notably on CPU)
+    with torch.inference_mode():
+        output = _generate_with_prefix_cache(model, processor, device, inputs, **generate_kwargs)
+        if output is None:
+            output = model.generate(**inputs, **generate_kwargs)
+    end = time.perf_counter()
+    # With left padding every row's prompt ends at the padded length, so one slice
+    # strips the prompt from all rows; the per-item lengths are the unpadded prompt sizes.
+    padded_length = inputs["input_ids"].shape[1]
+    prompt_lengths = inputs["attention_mask"].sum(dim=1).tolist()
+    new_tokens = output[:, padded_length:]
+    assert len(prompt_lengths) == new_tokens.shape[0] == len(batch)
+    # Prefill ends with the first token; rows that stopped early are padded out to the longest one
+    first_token_at = first_token_timer.first_token_at or end
+    observe_stage("prefill", first_token_at - start)
+    observe_stage("decode", end - first_token_at)
+    generated = int((new_tokens != processor.tokenizer.pad_token_id).sum())
+    record_tokens("ocr", sum(prompt_lengths), generated, end - first_token_at)
+    return processor.tokenizer.batch_decode(
         new_tokens, skip_special_tokens=True
     )
-    with open(output_file, "w", encoding="UTF-8") as f:
-        f.write(text_output[0])
-    # No return value
+
+
+def run_ocr_batch(items, max_batch_size=None):
+    """Run OCR over a list of (image, anchor_text) pairs, packing up to max_batch_size pages per generate call.
+
+    Returns the decoded outputs in the same order as `items`.
+    """
+    max_batch_size = max_batch_size or OCR_MAX_BATCH_SIZE
+    outputs = []
+    for start in range(0, len(items), max_batch_size):
+        outputs.extend(ocr_backend.generate_batch(items[start:start + max_batch_size]))
+    return outputs
+
+
+def _generate_ocr_text(image, anchor_text, on_text=None):
+    """Run the OCR backend on one page image and its anchor text and return the decoded output."""
+    return ocr_backend.generate_batch([(image, anchor_text)], on_text=on_text)[0]
+
+
+def _page_cache_key(file_hash, page_num, target_longest_image_dim, target_anchor_text_len):
+    return ocr_cache_key(
+        file_hash,
+        page_num,
+        target_longest_image_dim,
+        target_anchor_text_len,
+        ocr_backend.model_id,
+        OCR_GENERATION_KWARGS,
+    )
+
+
+def is_complete_ocr_output(ocr_text):
+    """Whether the model closed its JSON response; output cut off at OCR_MAX_NEW_TOKENS is not cached."""
+    return JSONObjectScanner().feed(ocr_text)
+
+
+def get_cached_page(file_path, page_num=1, target_longest_image_dim=1024, target_anchor_text_len=4000):
+    """Return (cache_key, cached OCR text or None) for one page of a file."""
+    if is_image_file(file_path) and not is_pdf_file(file_path):
+        page_num = 1  # Images have a single page whatever page_num was requested
+    cache_key = _page_cache_key(hash_file(file_path), page_num, target_longest_image_dim, target_anchor_text_len)
+    return cache_key, ocr_result_cache.get(cache_key)
+
+
+def run_ocr(file_path, page_num=1, target_longest_image_dim=1024, target_anchor_text_len=4000, output_file=None, use_cache=True, on_text=None):
+    """Run OCR on one page of a file (PDF or image) and return the model output.
+
+    If output_file is given, the result is also written there (used by main.py). If on_text is given,
+    it is called with each chunk of text as the model generates it (a cached result arrives as one chunk).
+    """
+    use_cache = use_cache and OCR_CACHE_ENABLED
+    ocr_text = None
+    if use_cache:
+        cache_key, ocr_text = get_cached_page(file_path, page_num, target_longest_image_dim, target_anchor_text_len)
+    if ocr_text is None:
+        image, anchor_text = process_file(file_path, page_num, target_longest_image_dim, target_anchor_text_len)
+        ocr_text = _generate_ocr_text(image, anchor_text, on_text=on_text)
+        if use_cache and is_complete_ocr_output(ocr_text):
+            ocr_result_cache.put(cache_key, ocr_text)
+    elif on_text is not None:
+        on_text(ocr_text)
+    if output_file is not None:
+        with open(output_file, "w", encoding="UTF-8") as f:
+            f.write(ocr_text)
+    return ocr_text
+
+
+def select_pages(file_path, pages="all"):
+    """The page numbers run_ocr_pages would process; raises ValueError for a bad selection or file type."""
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+    if is_pdf_file(file_path):
+        return parse_page_range(pages, get_pdf_page_count(file_path))
+    if is_image_file(file_path):
+        return parse_page_range(pages, 1)
+    raise ValueError(f"Unsupported file type: {file_path}")
+
+
+def run_ocr_pages(file_path, pages="all", target_longest_image_dim=1024, target_anchor_text_len=4000, batch_size=1, use_cache=True):
+    """Run OCR on several pages of a file, yielding {"page_num", "ocr_text"} for each page as soon as it is decoded.
+
+    `pages` accepts "all" (default), a single page ("3") or ranges ("1-4,7"). Images are treated as a
+    single-page document. With batch_size > 1, pages are decoded batch_size at a time in one generate call
+    and yielded together once their batch finishes. Cached pages are returned without running the model.
+    """
+    page_nums = select_pages(file_path, pages)
+
+    use_cache = use_cache and OCR_CACHE_ENABLED
+    cache_keys = {}
+    results = {}
+    if use_cache:
+        file_hash = hash_file(file_path)
+        for page_num in page_nums:
+            cache_keys[page_num] = _page_cache_key(file_hash, page_num, target_longest_image_dim, target_anchor_text_len)
+            cached = ocr_result_cache.get(cache_keys[page_num])
+            if cached is not None:
+                results[page_num] = cached
+
+    batch_size = max(1, min(batch_size, OCR_MAX_BATCH_SIZE))
+    # Pages that need the model are prepared ahead of time, at least one batch in advance
+    prepared = prefetch_pages(
+        file_path,
+        [page_num for page_num in page_nums if page_num not in results],
+        target_longest_image_dim,
+        target_anchor_text_len,
+        prefetch=max(batch_size, OCR_PREFETCH_PAGES),
+    )
+    try:
+        for start in range(0, len(page_nums), batch_size):
+            batch_pages = page_nums[start:start + batch_size]
+            missing_pages = [page_num for page_num in batch_pages if page_num not in results]
+            if missing_pages:
+                batch = [next(prepared)[1] for _ in missing_pages]
+                for page_num, ocr_text in zip(missing_pages, ocr_backend.generate_batch(batch)):
+                    results[page_num] = ocr_text
+                    if use_cache and is_complete_ocr_output(ocr_text):
+                        ocr_result_cache.put(cache_keys[page_num], ocr_text)
+            for page_num in batch_pages:
+                yield {"page_num": page_num, "ocr_text": results.pop(page_num)}
+    finally:
+        prepared.close()
 
 
 # Remove or comment out the __main__ block and any test file assignment, as this is now handled in main.py
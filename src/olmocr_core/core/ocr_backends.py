@@ -0,0 +1,271 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import observe_stage, record_tokens
+from model_manager import OCR_MODEL_ID, ocr_model
+
+# "transformers" runs the model in this process; "openai" sends pages to an OpenAI-compatible server
+# (vLLM, SGLang, ...) so API workers do not need to hold the weights
+OCR_BACKEND = os.environ.get("OCR_BACKEND", "transformers")
+OCR_SERVER_URL = os.environ.get("OCR_SERVER_URL", "http://localhost:8001/v1")
+OCR_SERVER_MODEL = os.environ.get("OCR_SERVER_MODEL", OCR_MODEL_ID)
+OCR_SERVER_API_KEY = os.environ.get("OCR_SERVER_API_KEY", "")
+# Pages of one batch sent to the server at once (and pooled connections kept open)
+OCR_SERVER_PARALLEL = int(os.environ.get("OCR_SERVER_PARALLEL", "8"))
+OCR_SERVER_CONNECT_TIMEOUT = float(os.environ.get("OCR_SERVER_CONNECT_TIMEOUT", "5"))
+OCR_SERVER_TIMEOUT = float(os.environ.get("OCR_SERVER_TIMEOUT", "300"))
+# How long a readiness check of the OCR server is reused before /ready asks the server again
+OCR_SERVER_READY_TTL = float(os.environ.get("OCR_SERVER_READY_TTL", "10"))
+
+
+class OCRBackend:
+    """Turns (image, anchor_text) pages into raw olmOCR model output.
+
+    generate_batch returns one decoded output per page, in order. With on_text (single-page batches
+    only), text is passed to on_text as it is generated.
+    """
+
+    name = None
+
+    @property
+    def model_id(self):
+        raise NotImplementedError
+
+    @property
+    def is_ready(self):
+        raise NotImplementedError
+
+    def load(self):
+        """Prepare the backend (load weights, check the server); safe to call repeatedly."""
+        raise NotImplementedError
+
+    def check_ready(self):
+        """Readiness for the /ready probe; may block briefly on I/O but never loads model weights."""
+        return self.is_ready
+
+    def generate_batch(self, batch, on_text=None):
+        raise NotImplementedError
+
+    def status(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class TransformersBackend(OCRBackend):
+    """The in-process Qwen2-VL model (batched generate, prefix cache, JSON stopping)."""
+
+    name = "transformers"
+
+    def __init__(self, manager=ocr_model):
+        self.manager = manager
+
+    @property
+    def model_id(self):
+        return self.manager.model_id
+
+    @property
+    def is_ready(self):
+        return self.manager.is_ready
+
+    def load(self):
+        self.manager.load()
+
+    def generate_batch(self, batch, on_text=None):
+        # Imported here: ocr.py selects its backend from this module
+        from ocr import _generate_ocr_batch
+
+        return _generate_ocr_batch(batch, on_text=on_text)
+
+    def status(self):
+        return {"backend": self.name, **self.manager.status()}
+
+
+class OpenAICompatibleBackend(OCRBackend):
+    """Sends each page to an OpenAI-compatible /chat/completions endpoint.
+
+    The messages are the same ones the in-process model sees, with the page embedded as an image_url
+    data URL. Pages of a batch are sent concurrently over a pooled session.
+    """
+
+    name = "openai"
+
+    def __init__(
+        self,
+        base_url=OCR_SERVER_URL,
+        model=OCR_SERVER_MODEL,
+        api_key=OCR_SERVER_API_KEY,
+        num_parallel=OCR_SERVER_PARALLEL,
+        timeout=OCR_SERVER_TIMEOUT,
+        connect_timeout=OCR_SERVER_CONNECT_TIMEOUT,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.api_key = api_key
+        self.num_parallel = num_parallel
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.state = "not_loaded"  # not_loaded -> ready | failed
+        self.error = None
+        self.load_seconds = None
+        self._checked_at = None
+        self._session = None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def model_id(self):
+        return self.model
+
+    @property
+    def is_ready(self):
+        return self.state == "ready"
+
+    def _get_session(self):
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.num_parallel)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                if self.api_key:
+                    session.headers["Authorization"] = f"Bearer {self.api_key}"
+                self._session = session
+                self._pool = ThreadPoolExecutor(max_workers=self.num_parallel, thread_name_prefix="ocr-server")
+            return self._session
+
+    def load(self):
+        """Check that the server is up and serves the configured model."""
+        start = time.perf_counter()
+        try:
+            response = self._get_session().get(f"{self.base_url}/models", timeout=(self.connect_timeout, 30))
+            response.raise_for_status()
+            served = [model["id"] for model in response.json().get("data", [])]
+            if served and self.model not in served:
+                raise RuntimeError(f"OCR server does not serve {self.model!r} (available: {', '.join(served)})")
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            raise
+        finally:
+            self._checked_at = time.monotonic()
+        self.state = "ready"
+        self.error = None
+        self.load_seconds = time.perf_counter() - start
+
+    def check_ready(self):
+        """Ask the server (at most every OCR_SERVER_READY_TTL seconds) instead of waiting for /warmup.
+
+        There are no weights to load, so the backend is ready as soon as the endpoint answers, and
+        stops being ready when it goes away.
+        """
+        if self._checked_at is None or time.monotonic() - self._checked_at > OCR_SERVER_READY_TTL:
+            try:
+                self.load()
+            except Exception:
+                pass
+        return self.is_ready
+
+    def _payload(self, image, anchor_text, stream=False):
+        from ocr import OCR_GENERATION_KWARGS, build_ocr_messages, image_to_base64png
+
+        return {
+            "model": self.model,
+            "messages": build_ocr_messages(anchor_text, image_to_base64png(image)),
+            "temperature": OCR_GENERATION_KWARGS["temperature"],
+            "max_tokens": OCR_GENERATION_KWARGS["max_new_tokens"],
+            "n": OCR_GENERATION_KWARGS["num_return_sequences"],
+            "stream": stream,
+        }
+
+    def _complete(self, item):
+        start = time.perf_counter()
+        response = self._get_session().post(
+            f"{self.base_url}/chat/completions",
+            json=self._payload(*item),
+            timeout=(self.connect_timeout, self.timeout),
+        )
+        response.raise_for_status()
+        result = response.json()
+        # Without streaming there is no first-token time to split prefill from decode
+        usage = result.get("usage") or {}
+        record_tokens("ocr", usage.get("prompt_tokens"), usage.get("completion_tokens"), time.perf_counter() - start)
+        return result["choices"][0]["message"]["content"]
+
+    def _complete_streaming(self, item, on_text):
+        chunks = []
+        start = time.perf_counter()
+        first_token_at = None
+        with self._get_session().post(
+            f"{self.base_url}/chat/completions",
+            json=self._payload(*item, stream=True),
+            timeout=(self.connect_timeout, self.timeout),
+            stream=True,
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                text = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                if text:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    chunks.append(text)
+                    on_text(text)
+        end = time.perf_counter()
+        first_token_at = first_token_at or end
+        observe_stage("prefill", first_token_at - start)
+        observe_stage("decode", end - first_token_at)
+        return "".join(chunks)
+
+    def generate_batch(self, batch, on_text=None):
+        if on_text is not None:
+            if len(batch) != 1:
+                raise ValueError("Token streaming is only supported for a single page at a time.")
+            return [self._complete_streaming(batch[0], on_text)]
+        self._get_session()
+        return list(self._pool.map(self._complete, batch))
+
+    def status(self):
+        return {
+            "backend": self.name,
+            "state": self.state,
+            "model_id": self.model,
+            "server_url": self.base_url,
+            "load_seconds": self.load_seconds,
+            "error": self.error,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._pool.shutdown(wait=False)
+                self._session = None
+                self._pool = None
+
+
+BACKENDS = {
+    TransformersBackend.name: TransformersBackend,
+    OpenAICompatibleBackend.name: OpenAICompatibleBackend,
+}
+
+
+def create_backend(name=OCR_BACKEND):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown OCR_BACKEND {name!r}; expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+# Process-wide backend used by ocr.py, the API and jobs
+ocr_backend = create_backend()
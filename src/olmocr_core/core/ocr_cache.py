@@ -0,0 +1,42 @@
+import hashlib
+import json
+import os
+
+from cache import DiskCache, LRUCache, TieredCache
+
+# OCR results are cached by content, so re-uploads of the same scan skip model.generate entirely.
+OCR_CACHE_ENABLED = os.environ.get("OCR_CACHE_ENABLED", "1") == "1"
+OCR_CACHE_MEMORY_ENTRIES = int(os.environ.get("OCR_CACHE_MEMORY_ENTRIES", "512"))
+OCR_CACHE_DIR = os.environ.get("OCR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "olmocr_core", "ocr"))
+OCR_CACHE_MAX_BYTES = int(os.environ.get("OCR_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+def hash_file(file_path):
+    """Return the SHA-256 hex digest of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def ocr_cache_key(file_hash, page_num, target_longest_image_dim, target_anchor_text_len, model_id, generation_kwargs):
+    """Build the cache key for one page: anything that can change the model output is part of it."""
+    key_material = json.dumps(
+        {
+            "file": file_hash,
+            "page": page_num,
+            "dim": target_longest_image_dim,
+            "anchor_len": target_anchor_text_len,
+            "model": model_id,
+            "generation": generation_kwargs,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+
+ocr_result_cache = TieredCache(
+    LRUCache(max_entries=OCR_CACHE_MEMORY_ENTRIES),
+    DiskCache(OCR_CACHE_DIR, max_bytes=OCR_CACHE_MAX_BYTES) if OCR_CACHE_MAX_BYTES > 0 else None,
+)
@@ -0,0 +1,101 @@
+"""Minimal OpenAI-compatible server for exercising OCR_BACKEND=openai without a GPU.
+
+It checks that each request carries the olmOCR prompt and a PNG data URL, then answers with a canned
+olmOCR-style JSON response (optionally after --delay seconds, to simulate decoding time).
+
+Usage: python ocr_stub_server.py [--port 8001] [--delay 0.5]
+Then:  OCR_BACKEND=openai OCR_SERVER_URL=http://localhost:8001/v1 uvicorn api:app
+"""
+import argparse
+import base64
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from model_manager import OCR_MODEL_ID
+
+
+def _page_response(image_bytes):
+    return json.dumps({
+        "primary_language": "en",
+        "is_rotation_valid": True,
+        "rotation_correction": 0,
+        "is_table": False,
+        "is_diagram": False,
+        "natural_text": f"Stub OCR output for a {len(image_bytes)} byte page image.",
+    })
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+    model = OCR_MODEL_ID
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [{"id": self.model, "object": "model"}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_json(404, {"error": "not found"})
+            return
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        try:
+            content = payload["messages"][0]["content"]
+            prompt = next(part["text"] for part in content if part["type"] == "text")
+            image_url = next(part["image_url"]["url"] for part in content if part["type"] == "image_url")
+            if not image_url.startswith("data:image/png;base64,") or "RAW_TEXT_START" not in prompt:
+                raise ValueError("expected an olmOCR prompt and a PNG data URL")
+            image_bytes = base64.b64decode(image_url.split(",", 1)[1])
+        except (KeyError, IndexError, StopIteration, ValueError) as e:
+            self._send_json(400, {"error": f"Malformed OCR request: {e}"})
+            return
+
+        time.sleep(self.delay)
+        text = _page_response(image_bytes)
+        if payload.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for start in range(0, len(text), 16):
+                chunk = {"choices": [{"index": 0, "delta": {"content": text[start:start + 16]}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+        self._send_json(200, {
+            "object": "chat.completion",
+            "model": payload.get("model", self.model),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"completion_tokens": len(text) // 4},
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible OCR server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before answering each page")
+    parser.add_argument("--model", default=OCR_MODEL_ID, help="Model id reported by /v1/models")
+    args = parser.parse_args()
+
+    StubHandler.delay = args.delay
+    StubHandler.model = args.model
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"Stub OCR server listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import asyncio
+import collections
+import json
+import os
+import random
+import threading
+import time
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import observe_stage, record_error, record_tokens
+
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "qwen2.5vl:7b")
+# Match the server's OLLAMA_NUM_PARALLEL: more in-flight requests than that only queue inside Ollama
+OLLAMA_NUM_PARALLEL = int(os.environ.get("OLLAMA_NUM_PARALLEL", "4"))
+OLLAMA_CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_TIMEOUT = float(os.environ.get("OLLAMA_TIMEOUT", "300"))
+OLLAMA_MAX_RETRIES = int(os.environ.get("OLLAMA_MAX_RETRIES", "2"))
+OLLAMA_RETRY_BACKOFF = float(os.environ.get("OLLAMA_RETRY_BACKOFF", "0.5"))
+
+# Status codes worth retrying: Ollama answers 503/429 while a model is loading or its queue is full
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def _record_call(result, seconds):
+    """Latency and token counts of one finished chat call (Ollama reports eval_duration in nanoseconds)."""
+    observe_stage("ollama", seconds)
+    eval_seconds = result.get("eval_duration", 0) / 1e9 or seconds
+    record_tokens("llm", result.get("prompt_eval_count"), result.get("eval_count"), eval_seconds)
+
+
+class RequestSlots:
+    """A limit on in-flight requests shared by threads and the event loop.
+
+    Callers that find no free slot queue up in arrival order, whether sync or async, and release() hands
+    the slot straight to the oldest one. Sync waiters block on an Event; async waiters await a future, so
+    waiting never ties up a thread.
+    """
+
+    def __init__(self, limit):
+        self._limit = limit
+        self._in_use = 0
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, waiter):
+        """Take a free slot, or queue waiter behind the earlier ones. Returns True if a slot was taken."""
+        with self._lock:
+            if self._in_use < self._limit and not self._waiters:
+                self._in_use += 1
+                return True
+            self._waiters.append(waiter)
+            return False
+
+    def _release(self):
+        with self._lock:
+            if not self._waiters:
+                self._in_use -= 1
+                return
+            waiter = self._waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+            return
+        loop, future = waiter
+        try:
+            loop.call_soon_threadsafe(self._grant, future)
+        except RuntimeError:
+            self._release()  # The waiter's loop is closed
+
+    def _grant(self, future):
+        # Runs on the waiter's loop, where cancellation also happens, so the check cannot race it
+        if future.cancelled():
+            self._release()
+        else:
+            future.set_result(None)
+
+    def __enter__(self):
+        event = threading.Event()
+        if not self._try_acquire(event):
+            event.wait()
+
+    def __exit__(self, *exc_info):
+        self._release()
+
+    async def __aenter__(self):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = (loop, future)
+        if self._try_acquire(waiter):
+            return
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = waiter in self._waiters
+                if queued:
+                    self._waiters.remove(waiter)
+            if not queued and future.done() and not future.cancelled():
+                self._release()  # Handed a slot just as the wait was cancelled
+            raise
+
+    async def __aexit__(self, *exc_info):
+        self._release()
+
+
+class OllamaClient:
+    """Shared Ollama chat client with pooled connections, bounded concurrency, timeouts and retries.
+
+    The sync methods use a pooled requests.Session and the async methods a single httpx.AsyncClient.
+    Both take the same slots, so the process never has more than num_parallel requests in flight.
+    """
+
+    def __init__(
+        self,
+        base_url=OLLAMA_BASE_URL,
+        model=OLLAMA_MODEL,
+        num_parallel=OLLAMA_NUM_PARALLEL,
+        timeout=OLLAMA_TIMEOUT,
+        connect_timeout=OLLAMA_CONNECT_TIMEOUT,
+        max_retries=OLLAMA_MAX_RETRIES,
+        retry_backoff=OLLAMA_RETRY_BACKOFF,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.num_parallel = num_parallel
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._slots = RequestSlots(num_parallel)
+        self._async_client = None
+
+    def _get_session(self):
+        with self._session_lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.num_parallel)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    def _get_async_client(self):
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.num_parallel, max_keepalive_connections=self.num_parallel),
+            )
+        return self._async_client
+
+    def _backoff_seconds(self, attempt):
+        # Exponential backoff with jitter so retries from many workers do not arrive in lockstep
+        return self.retry_backoff * (2 ** attempt) * (0.5 + random.random())
+
+    def chat(self, payload, timeout=None):
+        """POST a chat payload to /api/chat and return the decoded JSON response."""
+        session = self._get_session()
+        timeout = (self.connect_timeout, timeout or self.timeout)
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                with self._slots:
+                    response = session.post(f"{self.base_url}/api/chat", json=payload, timeout=timeout)
+                if response.status_code in RETRYABLE_STATUS_CODES and attempt < self.max_retries:
+                    raise requests.HTTPError(f"Ollama returned {response.status_code}", response=response)
+                response.raise_for_status()
+                result = response.json()
+                _record_call(result, time.perf_counter() - start)
+                return result
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                retryable = not isinstance(e, requests.HTTPError) or e.response.status_code in RETRYABLE_STATUS_CODES
+                if not retryable or attempt >= self.max_retries:
+                    record_error("ollama")
+                    raise
+                time.sleep(self._backoff_seconds(attempt))
+                attempt += 1
+
+    async def chat_async(self, payload, timeout=None):
+        """Async version of chat() for use from the API's event loop."""
+        client = self._get_async_client()
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                async with self._slots:
+                    response = await client.post("/api/chat", json=payload, timeout=timeout or httpx.USE_CLIENT_DEFAULT)
+                if response.status_code in RETRYABLE_STATUS_CODES and attempt < self.max_retries:
+                    raise httpx.HTTPStatusError(f"Ollama returned {response.status_code}", request=response.request, response=response)
+                response.raise_for_status()
+                result = response.json()
+                _record_call(result, time.perf_counter() - start)
+                return result
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                retryable = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code in RETRYABLE_STATUS_CODES
+                if not retryable or attempt >= self.max_retries:
+                    record_error("ollama")
+                    raise
+                await asyncio.sleep(self._backoff_seconds(attempt))
+                attempt += 1
+
+    async def chat_stream_async(self, payload, timeout=None):
+        """Stream a chat response, yielding each decoded JSON chunk as Ollama sends it.
+
+        The payload is sent with "stream": true. Retries are not attempted once streaming has started.
+        """
+        client = self._get_async_client()
+        payload = {**payload, "stream": True}
+        start = time.perf_counter()
+        try:
+            async with self._slots:
+                async with client.stream("POST", "/api/chat", json=payload, timeout=timeout or httpx.USE_CLIENT_DEFAULT) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if line.strip():
+                            chunk = json.loads(line)
+                            if chunk.get("done"):
+                                # The final chunk carries the token counts
+                                _record_call(chunk, time.perf_counter() - start)
+                            yield chunk
+        except (httpx.TransportError, httpx.HTTPStatusError):
+            record_error("ollama")
+            raise
+
+    def close(self):
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+def response_content(result):
+    """Return the model's message text from an Ollama chat response with any ```json fence removed."""
+    content = result["message"]["content"] if "message" in result else result.get("response", "")
+    content = content.strip()
+    if content.startswith('```json'):
+        content = content[7:]
+    if content.endswith('```'):
+        content = content[:-3]
+    return content.strip()
+
+
+# Process-wide client shared by every Ollama caller
+ollama = OllamaClient()
@@ -0,0 +1,155 @@
+import os
+
+# Set OCR_PREFIX_CACHE=0 to always prefill the whole prompt
+OCR_PREFIX_CACHE = os.environ.get("OCR_PREFIX_CACHE", "1") == "1"
+# transformers versions whose Qwen2-VL reads the rope_deltas attribute set in prefill() (4.45 and 4.46
+# only take it from generate's model_kwargs); outside this range the cache is turned off, because a
+# version that kept the attribute but stopped reading it would decode with wrong M-RoPE positions.
+# requirements.txt pins the same range (tests/test_transformers_pin.py keeps them identical)
+SUPPORTED_TRANSFORMERS = ("4.47.0", "4.50.0")
+
+
+class PromptPrefixCache:
+    """Past key/values for the fixed start of every olmOCR prompt, computed once per model load.
+
+    Every page prompt starts with the same tokens: the chat template's system turn, the user turn header
+    and build_finetuning_prompt's instructions up to RAW_TEXT_START. Those tokens are prefilled once; each
+    request then only prefills its own anchor text and image.
+
+    Batches are left-padded, which would put the prefix at a different offset in every row. Rows are
+    rearranged to [prefix][padding][rest of prompt] (the attention mask hides the padding, and
+    get_rope_index skips it), so the same cached prefix serves every row.
+    """
+
+    def __init__(self, model, processor, device, prefix_text):
+        import torch
+
+        _check_transformers_version()
+        self.model = model
+        self.device = device
+        prefix_ids = processor.tokenizer(prefix_text, add_special_tokens=False, return_tensors="pt")["input_ids"][0]
+        # Drop the last token so a tokenizer merge across the prefix boundary cannot cause a mismatch
+        self.prefix_ids = prefix_ids[:-1].to(device)
+        self.prefix_length = self.prefix_ids.shape[0]
+        with torch.inference_mode():
+            output = model(input_ids=self.prefix_ids[None], use_cache=True)
+        self._prefix_layers = _to_legacy(output.past_key_values)
+
+    def _rearrange(self, input_ids, attention_mask):
+        """Move each row's left padding behind the prefix. Returns None if a row does not start with the prefix."""
+        import torch
+
+        prefix_length = self.prefix_length
+        new_ids = torch.empty_like(input_ids)
+        new_mask = torch.empty_like(attention_mask)
+        seq_length = input_ids.shape[1]
+        for row in range(input_ids.shape[0]):
+            pad = seq_length - int(attention_mask[row].sum())
+            if not torch.equal(input_ids[row, pad:pad + prefix_length], self.prefix_ids):
+                return None
+            new_ids[row] = torch.cat([self.prefix_ids, input_ids[row, :pad], input_ids[row, pad + prefix_length:]])
+            new_mask[row] = torch.cat([attention_mask[row, pad:pad + prefix_length], attention_mask[row, :pad], attention_mask[row, pad + prefix_length:]])
+        return new_ids, new_mask
+
+    def prefill(self, inputs):
+        """Prefill inputs on top of the cached prefix, leaving the last prompt token for generate().
+
+        Returns (input_ids, attention_mask, past_key_values) with rows rearranged as described above, or
+        None when the inputs do not start with the cached prefix.
+        """
+        import torch
+        from transformers import DynamicCache
+
+        model = self.model
+        rearranged = self._rearrange(inputs["input_ids"], inputs["attention_mask"])
+        if rearranged is None:
+            return None
+        input_ids, attention_mask = rearranged
+        batch_size, seq_length = input_ids.shape
+        prefix_length = self.prefix_length
+
+        get_rope_index = getattr(model, "get_rope_index", None) or model.model.get_rope_index
+        position_ids, rope_deltas = get_rope_index(input_ids, inputs.get("image_grid_thw"), None, attention_mask)
+
+        cache = DynamicCache.from_legacy_cache(tuple(
+            (key.expand(batch_size, -1, -1, -1).contiguous(), value.expand(batch_size, -1, -1, -1).contiguous())
+            for key, value in self._prefix_layers
+        ))
+        with torch.inference_mode():
+            model(
+                input_ids=input_ids[:, prefix_length:seq_length - 1],
+                attention_mask=attention_mask[:, :seq_length - 1],
+                position_ids=position_ids[:, :, prefix_length:seq_length - 1],
+                pixel_values=inputs.get("pixel_values"),
+                image_grid_thw=inputs.get("image_grid_thw"),
+                past_key_values=cache,
+                use_cache=True,
+                cache_position=torch.arange(prefix_length, seq_length - 1, device=input_ids.device),
+            )
+        # Decode steps derive their rotary positions from rope_deltas; depending on the transformers
+        # version it lives on the top-level model or on the inner model
+        modules = [module for module in (model, getattr(model, "model", None)) if hasattr(module, "rope_deltas")]
+        if not modules:
+            raise RuntimeError("the model has no rope_deltas attribute; decoding would use wrong positions")
+        for module in modules:
+            module.rope_deltas = rope_deltas
+        return input_ids, attention_mask, cache
+
+    def generate(self, inputs, **generate_kwargs):
+        """model.generate(**inputs, **generate_kwargs), reusing the cached prefix.
+
+        Returns None when the inputs do not start with the cached prefix; the caller should then
+        run a normal generate. Output rows are rearranged, but the prompt still ends at the padded
+        length, so new tokens are sliced the same way.
+        """
+        prefilled = self.prefill(inputs)
+        if prefilled is None:
+            return None
+        input_ids, attention_mask, cache = prefilled
+        return self.model.generate(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            past_key_values=cache,
+            **generate_kwargs,
+        )
+
+
+def _check_transformers_version():
+    import transformers
+    from packaging.version import Version
+
+    low, high = SUPPORTED_TRANSFORMERS
+    if not Version(low) <= Version(transformers.__version__) < Version(high):
+        raise RuntimeError(
+            f"transformers {transformers.__version__} is outside the range the prefix cache is checked "
+            f"against ({low} <= version < {high})"
+        )
+
+
+def matches_plain_generate(model, processor, device, inputs, prefix_text, max_new_tokens=16):
+    """Whether greedy decoding through the prefix cache reproduces a plain model.generate token for token."""
+    import torch
+
+    generate_kwargs = {"max_new_tokens": max_new_tokens, "do_sample": False}
+    prompt_length = inputs["input_ids"].shape[1]
+    with torch.inference_mode():
+        expected = model.generate(**inputs, **generate_kwargs)[:, prompt_length:]
+        actual = PromptPrefixCache(model, processor, device, prefix_text).generate(inputs, **generate_kwargs)
+    return actual is not None and torch.equal(actual[:, prompt_length:], expected)
+
+
+def _to_legacy(past_key_values):
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    return tuple(past_key_values)
+
+
+_prefix_cache = None
+
+
+def get_prefix_cache(model, processor, device, prefix_text):
+    """Return the prefix cache for this model, building it on first use (or after the model was reloaded)."""
+    global _prefix_cache
+    if _prefix_cache is None or _prefix_cache.model is not model:
+        _prefix_cache = PromptPrefixCache(model, processor, device, prefix_text)
+    return _prefix_cache
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The core modules import each other as top-level modules (the API runs from src/olmocr_core/core)
+CORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "olmocr_core", "core")
+sys.path.insert(0, CORE_DIR)
@@ -0,0 +1,37 @@
+import os
+import time
+
+from cache import DiskCache
+
+
+def test_put_leaves_no_temp_files(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.put("a", "value")
+    cache.put("a", "other")
+    assert cache.get("a") == "other"
+    assert os.listdir(tmp_path) == ["a.txt"]
+
+
+def test_eviction_uses_the_size_on_disk(tmp_path):
+    writer = DiskCache(str(tmp_path), max_bytes=25)
+    other = DiskCache(str(tmp_path), max_bytes=25)
+    writer.put("old", "x" * 10)
+    time.sleep(0.01)
+    # Another process's entry: writer's own running total does not include it
+    other.put("new", "y" * 10)
+    time.sleep(0.01)
+    writer.rescan_seconds = 0
+    writer.put("newest", "z" * 10)
+    assert writer.get("old") is None
+    assert writer.get("new") == "y" * 10
+    assert writer.size_bytes() == 20
+
+
+def test_eviction_skips_entries_removed_by_another_process(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path), max_bytes=15)
+    cache.put("a", "x" * 10)
+    listed = cache._entries()
+    os.remove(os.path.join(tmp_path, "a.txt"))
+    monkeypatch.setattr(cache, "_entries", lambda: listed + [os.path.join(tmp_path, "b.txt")])
+    cache.put("b", "y" * 10)
+    assert cache.get("b") == "y" * 10
@@ -0,0 +1,51 @@
+import pytest
+
+from entity_rules import extract_entities, merge_entities, types_needing_llm
+
+
+@pytest.mark.parametrize("text", [
+    "2023-07-10",
+    "2024/03/15",
+    "01/15/2023",
+    "15.01.23",
+    "March 5, 2022",
+    "March 5",
+    "July 6th",
+    "5 March 2022",
+    "06 Jul 25",
+    "29 February 2024",
+])
+def test_dates_are_found(text):
+    assert extract_entities(f"Due: {text}.")["dates"] == [text]
+
+
+@pytest.mark.parametrize("text", ["12-34-5678", "32/13/2023", "99-99-99", "2024-13-01", "Feb 30, 2020", "we may 12 go"])
+def test_non_dates_are_rejected(text):
+    assert extract_entities(text)["dates"] == []
+
+
+def test_emails_and_phone_numbers():
+    entities = extract_entities("**Email:** jane.doe@example.com\nPhone: 555 123 4567\nCall +44 20 7946 0958")
+    assert entities["emails"] == ["jane.doe@example.com"]
+    assert entities["phone_numbers"] == ["+44 20 7946 0958", "555 123 4567"]
+
+
+def test_labeled_names_must_look_like_person_names():
+    text = "Name: The Great Gatsby\nName: Jane Doe\nBill To: Ludwig van Beethoven\nName: Order 12345"
+    assert extract_entities(text)["names"] == ["Jane Doe", "Ludwig van Beethoven"]
+
+
+def test_labeled_address_picks_up_continuation_line():
+    text = "Shipping Address: 456 Elm St, Apt 7B\nNew York, NY 10001\nTotal: $5"
+    assert extract_entities(text)["addresses"] == ["456 Elm St, Apt 7B, New York, NY 10001"]
+
+
+def test_only_emails_skip_the_llm():
+    assert types_needing_llm(("names", "dates", "addresses", "emails")) == ["names", "dates", "addresses"]
+    assert types_needing_llm(("emails",)) == []
+
+
+def test_rule_matches_are_added_to_the_llm_answer():
+    rules = {"names": ["Jane Doe"], "dates": ["March 5"]}
+    llm = {"names": ["John Smith", "jane doe"], "dates": []}
+    assert merge_entities(rules, llm) == {"names": ["Jane Doe", "John Smith"], "dates": ["March 5"]}
@@ -0,0 +1,38 @@
+from extraction_chunks import CHARS_PER_TOKEN, estimate_tokens, merge_extractions, split_into_chunks
+
+
+def test_small_pages_share_a_chunk():
+    assert split_into_chunks(["page one", "page two"], max_tokens=100) == ["page one\n\npage two"]
+
+
+def test_heading_moves_to_the_chunk_with_its_section():
+    chunks = split_into_chunks(["# Totals", "amount " * 30], max_tokens=20)
+    assert chunks[0].startswith("# Totals\n\namount")
+    assert all(chunk.strip() != "# Totals" for chunk in chunks)
+
+
+def test_heading_inside_an_oversized_page_stays_with_its_body():
+    page = "intro " * 10 + "\n## Section B\n" + "body " * 40
+    chunks = split_into_chunks([page], max_tokens=20)
+    assert not any(chunk.strip() == "## Section B" for chunk in chunks)
+    assert any(chunk.startswith("## Section B\n\nbody") for chunk in chunks)
+
+
+def test_oversized_text_is_cut_between_words():
+    words = [f"word{index}" for index in range(200)]
+    chunks = split_into_chunks([" ".join(words)], max_tokens=16)
+    assert all(len(chunk) <= 16 * CHARS_PER_TOKEN for chunk in chunks)
+    assert " ".join(chunk.strip() for chunk in chunks).split() == words
+
+
+def test_single_overlong_word_is_still_cut():
+    chunks = split_into_chunks(["x" * 100], max_tokens=5)
+    assert "".join(chunks) == "x" * 100
+    assert all(estimate_tokens(chunk) <= 5 for chunk in chunks)
+
+
+def test_merge_continues_a_table_split_across_chunks():
+    first = {"tables": [{"headers": ["Item", "Price"], "rows": [["A", "1"]]}]}
+    second = {"tables": [{"headers": [], "rows": [["B", "2"]]}]}
+    merged = merge_extractions([first, second], full_text="")
+    assert merged["tables"] == [{"headers": ["Item", "Price"], "rows": [["A", "1"], ["B", "2"]]}]
@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip("pydantic")
+pytest.importorskip("prometheus_client")
+
+from extraction_schemas import Entities, ExtractionOutputError, Table, entities_format, validate_partial_json
+
+
+def test_entities_format_is_restricted_to_the_requested_types():
+    schema = entities_format(["names", "dates"])
+    assert list(schema["properties"]) == ["names", "dates"]
+    assert schema["required"] == ["names", "dates"]
+    assert schema["properties"]["names"] == Entities.model_json_schema()["properties"]["names"]
+
+
+def test_complete_output_is_validated():
+    assert validate_partial_json(Table, '{"headers": ["a"], "rows": [["1"]]}') == {"headers": ["a"], "rows": [["1"]]}
+
+
+def test_truncated_output_keeps_completed_fields():
+    assert validate_partial_json(Table, '{"headers": ["a", "b"], "rows": [["1", "2"], ["3"')["headers"] == ["a", "b"]
+
+
+def test_complete_json_that_does_not_match_the_schema_is_an_error():
+    with pytest.raises(ExtractionOutputError, match="does not match"):
+        validate_partial_json(Table, '{"headers": "a", "rows": []}')
+
+
+def test_unparseable_output_is_an_error():
+    with pytest.raises(ExtractionOutputError, match="not valid JSON"):
+        validate_partial_json(Table, "not json")
@@ -0,0 +1,24 @@
+import jobs
+from jobs import JobStore
+
+
+def test_results_are_only_written_by_the_current_owner(tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    store.create("job", "doc.pdf", "doc.pdf", "all", False, 1)
+    assert store.claim("job", "first")
+    # The first worker stalls past its lease and a second worker takes the job over
+    monkeypatch.setattr(jobs, "JOBS_LEASE_SECONDS", -1)
+    assert store.claim("job", "second")
+
+    assert not store.update_owned("job", "first", results=[{"page_num": 1, "ocr_text": "stale"}])
+    assert store.update_owned("job", "second", results=[{"page_num": 1, "ocr_text": "fresh"}])
+    assert store.get("job")["results"] == [{"page_num": 1, "ocr_text": "fresh"}]
+
+
+def test_results_are_not_written_to_a_finished_job(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    store.create("job", "doc.pdf", "doc.pdf", "all", False, 1)
+    assert store.claim("job", "worker")
+    assert store.transition("job", "running", "cancelled", owner="worker")
+    assert not store.update_owned("job", "worker", results=[{"page_num": 1, "ocr_text": "late"}])
+    assert store.get("job")["results"] == []
@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from json_stream import IncrementalJSONParser, parse_partial_json, repair_truncated_json
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Cut inside a string value: kept up to where it stopped
+    ('{"natural_text": "Invoice 12', {"natural_text": "Invoice 12"}),
+    # Cut inside an escape sequence
+    ('{"text": "a\\u00', {"text": "a"}),
+    # Cut inside or right after a key: the dangling key is dropped
+    ('{"lang": "en", "natural_te', {"lang": "en"}),
+    ('{"lang": "en", "natural_text"', {"lang": "en"}),
+    ('{"lang": "en", "natural_text": ', {"lang": "en"}),
+    # Cut after a comma
+    ('{"lang": "en", ', {"lang": "en"}),
+    ('{"pages": [1, 2, ', {"pages": [1, 2]}),
+    # Cut inside a nested array
+    ('{"rows": [["a", "b"], ["c", "d', {"rows": [["a", "b"], ["c", "d"]]}),
+    ('{"rows": [["a", "b"], [', {"rows": [["a", "b"], []]}),
+    # A number is only complete once a delimiter follows it
+    ('{"rotation": 90, "angle": 18', {"rotation": 90}),
+])
+def test_repair_truncated_json(text, expected):
+    assert json.loads(repair_truncated_json(text)) == expected
+
+
+def test_repair_ignores_text_around_the_document():
+    assert repair_truncated_json('```json\n{"a": 1}\n```') == '{"a": 1}'
+    assert repair_truncated_json("no json here") is None
+
+
+def test_parse_partial_json_prefers_the_complete_document():
+    assert parse_partial_json('{"a": [1, 2]}') == {"a": [1, 2]}
+    assert parse_partial_json('{"a": [1, 2') == {"a": [1]}
+    assert parse_partial_json("") is None
+
+
+def test_incremental_parser_reports_fields_as_they_complete():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"lang": "en", "rows": [[1') == [("lang", "en")]
+    assert parser.feed(', 2]], "text": "a, {b}"') == [("rows", [[1, 2]])]
+    assert parser.feed("}") == [("text", "a, {b}")]
+    assert parser.complete
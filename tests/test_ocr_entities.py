@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("olmocr")
+
+import ocr
+
+TEXT = "Invoice\nName: Jane Doe\nEmail: jane@example.com\nDate: March 5, 2022"
+
+
+def test_emails_only_request_does_not_call_the_llm(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("Ollama should not be called")
+
+    monkeypatch.setattr(ocr, "ENTITY_RULES_ENABLED", True)
+    monkeypatch.setattr(ocr, "_request_ollama_content", fail)
+    assert ocr.call_ollama_entities_extraction(TEXT, entity_types=("emails",)) == {"emails": ["jane@example.com"]}
+
+
+def test_llm_is_asked_only_for_the_types_the_rules_cannot_settle(monkeypatch):
+    payloads = []
+
+    def answer(payload, cache_key):
+        payloads.append(payload)
+        return '{"names": ["Jane Doe"], "dates": []}'
+
+    monkeypatch.setattr(ocr, "ENTITY_RULES_ENABLED", True)
+    monkeypatch.setattr(ocr, "_request_ollama_content", answer)
+    result = ocr.call_ollama_entities_extraction(TEXT, use_cache=False, entity_types=("names", "dates", "emails"))
+    assert list(payloads[0]["format"]["properties"]) == ["names", "dates"]
+    assert result == {"names": ["Jane Doe"], "dates": ["March 5, 2022"], "emails": ["jane@example.com"]}
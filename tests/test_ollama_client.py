@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+
+from ollama_client import RequestSlots
+
+
+def test_async_waiters_do_not_use_threads_and_respect_the_limit():
+    slots = RequestSlots(2)
+    in_flight = peak = 0
+    threads_before = threading.active_count()
+
+    async def request():
+        nonlocal in_flight, peak
+        async with slots:
+            in_flight += 1
+            peak = max(peak, in_flight)
+            assert threading.active_count() == threads_before
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+
+    async def main():
+        await asyncio.gather(*(request() for _ in range(20)))
+
+    asyncio.run(main())
+    assert peak == 2
+
+
+def test_waiters_are_served_in_arrival_order():
+    slots = RequestSlots(1)
+    order = []
+
+    async def request(name):
+        async with slots:
+            order.append(name)
+            await asyncio.sleep(0.001)
+
+    async def main():
+        async with slots:
+            tasks = [asyncio.create_task(request(name)) for name in range(5)]
+            await asyncio.sleep(0.01)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order == [0, 1, 2, 3, 4]
+
+
+def test_sync_and_async_callers_share_the_limit():
+    slots = RequestSlots(1)
+    in_flight = peak = 0
+    lock = threading.Lock()
+
+    def enter():
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+
+    def leave():
+        nonlocal in_flight
+        with lock:
+            in_flight -= 1
+
+    def sync_request():
+        with slots:
+            enter()
+            time.sleep(0.01)
+            leave()
+
+    async def async_request():
+        async with slots:
+            enter()
+            await asyncio.sleep(0.01)
+            leave()
+
+    threads = [threading.Thread(target=sync_request) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+
+    async def main():
+        await asyncio.gather(*(async_request() for _ in range(3)))
+
+    asyncio.run(main())
+    for thread in threads:
+        thread.join()
+    assert peak == 1
+
+
+def test_cancelled_waiter_gives_its_slot_back():
+    slots = RequestSlots(1)
+
+    async def main():
+        async with slots:
+            waiter = asyncio.create_task(slots.__aenter__())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+        # The slot is free again, not leaked to the cancelled waiter
+        await asyncio.wait_for(slots.__aenter__(), 1)
+        await slots.__aexit__(None, None, None)
+
+    asyncio.run(main())
+
+
+def test_slot_granted_while_cancelling_is_released():
+    slots = RequestSlots(1)
+
+    async def main():
+        await slots.__aenter__()
+        waiter = asyncio.create_task(slots.__aenter__())
+        await asyncio.sleep(0)
+        # Release from another thread: the handoff is scheduled on the loop, then the waiter is cancelled
+        thread = threading.Thread(target=slots._release)
+        thread.start()
+        thread.join()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        await asyncio.sleep(0)
+        await asyncio.wait_for(slots.__aenter__(), 1)
+
+    asyncio.run(main())
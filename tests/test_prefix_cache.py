@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("olmocr")
+
+from conftest import CORE_DIR
+
+
+@pytest.fixture(scope="module")
+def tiny_model():
+    """The random two-layer Qwen2-VL from bench_stages.py with the production processor (from the HF cache)."""
+    from transformers import AutoProcessor
+
+    from bench_stages import build_tiny_model
+    from model_manager import OCR_PROCESSOR_ID
+
+    try:
+        processor = AutoProcessor.from_pretrained(OCR_PROCESSOR_ID)
+    except OSError as e:
+        pytest.skip(f"processor {OCR_PROCESSOR_ID} is not available: {e}")
+    processor.tokenizer.padding_side = "left"
+    return build_tiny_model(processor), processor
+
+
+def test_greedy_output_matches_plain_generate(tiny_model):
+    from ocr import _ocr_prompt_prefix, _prepare_ocr_inputs, process_image_file
+    from prefix_cache import matches_plain_generate
+
+    model, processor = tiny_model
+    device = torch.device("cpu")
+    image, anchor_text = process_image_file(os.path.join(CORE_DIR, "..", "test_ocr_files", "ocr_demo_paper.png"), 448)
+    # Different anchor lengths give the rows different amounts of left padding
+    batch = [(image, anchor_text), (image, anchor_text + "\n[Text block 10x10 to 200x40]\nSome anchor text")]
+    inputs = _prepare_ocr_inputs(batch, processor, device)
+
+    assert matches_plain_generate(model, processor, device, inputs, _ocr_prompt_prefix(processor), max_new_tokens=8)
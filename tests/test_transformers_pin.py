@@ -0,0 +1,11 @@
+import os
+
+from conftest import CORE_DIR
+from prefix_cache import SUPPORTED_TRANSFORMERS
+
+
+def test_requirements_pin_the_prefix_cache_range():
+    with open(os.path.join(CORE_DIR, "..", "..", "..", "requirements.txt"), encoding="utf-8") as f:
+        pins = [line.strip() for line in f if line.startswith("transformers")]
+    low, high = SUPPORTED_TRANSFORMERS
+    assert pins == [f"transformers>={low},<{high}"]